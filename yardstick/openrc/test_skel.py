@@ -42,6 +42,7 @@ class VimrcTests(unittest.TestCase):
     args = None
     sudoPwd = None
     ts = None
+    snapshot = None
 
     def test_root_exrc(self):
         self.assertTrue(os.path.isfile("/root/.exrc"))
@@ -16,22 +16,13 @@
 # You should have received a copy of the GNU General Public License
 # along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
 
-import argparse
-import inspect
-import ipaddress
+import collections
 import logging
-import logging.handlers
 import os
 import os.path
-import subprocess
 import sys
+import textwrap
 import time
-import unittest
-
-import execnet
-
-import yardstick.ops.checker
-import yardstick.ops.modder
 
 __doc__ = """
 
@@ -42,38 +33,94 @@ It lets you select and launch:
 * tests written in Python
 * modification tasks controlled by a `.ini` file
 
+The command line interface imports this module for its defaults.
+To keep start up fast, the heavier modules are imported only by the
+functions which need them.
+
 """
 
+DFLT_CACHE = os.path.expanduser(os.path.join("~", ".cache", "yardstick"))
+DFLT_CONTROL = os.path.expanduser(os.path.join("~", ".ssh", "yardstick"))
 DFLT_IDENTITY = os.path.expanduser(os.path.join("~", ".ssh", "id_rsa"))
 DFLT_PORT = 22
+DFLT_PROBES = 64
 DFLT_USER = "root"
+DFLT_WIDTH = 8
+DFLT_WORKERS = 4
 KNOWN_HOSTS = os.path.expanduser(os.path.join("~", ".ssh", "known_hosts"))
 
 
 def forget_host(host):
+    import subprocess
     subprocess.check_call(["ssh-keygen", "-f", KNOWN_HOSTS, "-R", host])
 
 
-def execnet_string(ini, args):
-    settings = yardstick.ops.modder.config_settings(ini)
+def control_options(persist, path=DFLT_CONTROL):
+    """
+    Return SSH options which share one connection per host.
+
+    The first connection to a host becomes the master, and listens on
+    a control socket in `path`. Later connections, including those of
+    subsequent invocations, reuse its authenticated transport. The
+    master exits once it has been idle for `persist` seconds.
+
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return (
+        "-o ControlMaster=auto -o ControlPath={path} "
+        "-o ControlPersist={persist}"
+    ).format(path=os.path.join(path, "%C"), persist=int(persist))
+
+
+def target_host(plan, args):
+    """
+    Return the address of the host a session operates.
+
+    """
+    import ipaddress
+    return args.host or str(
+        ipaddress.ip_interface(plan["settings"]["admin.net"]).ip
+    )
+
+
+def target_probe(probe, host):
+    """
+    Direct a `port` probe which names no host at the target.
+
+    A local Wait section runs on the controller, so `port:nnnn` there
+    means a port of the host being operated.
+
+    :returns: The probe, qualified by `host` where necessary.
+    """
+    kind, _, target = (probe or "").partition(":")
+    if kind == "port" and ":" not in target and host:
+        return "port:{}:{}".format(host, target)
+    return probe
+
+
+def execnet_string(plan, args):
+    settings = plan["settings"]
     port = args.port or settings["admin.port"] or DFLT_PORT
     user = args.user or settings["admin.user"] or DFLT_USER
-    host = args.host or ipaddress.ip_interface(settings["admin.net"]).ip
+    host = target_host(plan, args)
     python = args.python or settings["admin.python"] or sys.executable
+    persist = getattr(args, "persist", None)
 
     if host in (None, "0.0.0.0", "127.0.0.1", "localhost"):
         rv = "popen//dont_write_bytecode"
     else:
         rv = (
-            "ssh=-i {identity} -p {port} {user}@{host}"
+            "ssh={control}-i {identity} -p {port} {user}@{host}"
             "//python={python}"
         ).format(
+            control=control_options(persist) + " " if persist else "",
             identity=os.path.expanduser(args.identity),
             host=host, port=port, user=user, python=python
         )
     return rv
 
 def log_setup(args, name="yardstick"):
+    import logging.handlers
     log = logging.getLogger(name)
 
     log.setLevel(args.log_level)
@@ -97,80 +144,408 @@ def log_setup(args, name="yardstick"):
 
 
 def gen_auto_tasks(args):
+    import yardstick.ops.modder
     for spec in args.modules:
         mod = None  # FIXME:
         yield mod
     yield yardstick.ops.modder
 
 
-def gen_check_tasks(args):
-    ldr = unittest.defaultTestLoader
-    testClasses = {
-        type(meth)
-        for i in args.modules + args.paths
-        for mod in ldr.discover(i)
-        for suite in mod for meth in suite
+def gen_imports(text, modules):
+    """
+    Generate the import statements for a program.
+
+    Each of `modules` which `text` refers to by name is imported. The
+    rest are bound to a stand-in from
+    :py:func:`yardstick.ops.checker.lazy_import`, which `text` must
+    define.
+
+    """
+    import ast
+    names = {
+        node.id for node in ast.walk(ast.parse(text))
+        if isinstance(node, ast.Name)
     }
+    roots = collections.OrderedDict.fromkeys(i.split(".")[0] for i in modules)
+    for mod in modules:
+        if mod.split(".")[0] in names:
+            yield "import {}".format(mod)
+
+    for root in roots:
+        if root not in names:
+            yield '{0} = lazy_import("{0}")'.format(root)
+
+
+def program_text(body):
+    """
+    Complete the source of a check program with its imports.
+
+    """
+    import inspect
+    import yardstick.ops.checker
+    lazy = inspect.getsource(yardstick.ops.checker.lazy_import)
+    imports = list(gen_imports(
+        "\n".join((lazy, body)), yardstick.ops.checker.imports
+    ))
+    return "\n".join((
+        yardstick.ops.checker.shebang,
+        "\n".join(i for i in imports if i.startswith("import")),
+        "",
+        lazy,
+        "\n".join(i for i in imports if not i.startswith("import")),
+        "",
+        body
+    ))
+
+
+def helpers_text():
+    """
+    Return the source of the functions every check program uses.
+
+    Module constants they need are defined first.
+    """
+    import inspect
+    import yardstick.ops.checker
+    import yardstick.ops.modder
+    return "\n".join([
+        "STATE_PATH = {!r}".format(yardstick.ops.modder.STATE_PATH),
+        "CHECKS_PATH = {!r}".format(yardstick.ops.checker.CHECKS_PATH),
+        "",
+    ] + [inspect.getsource(i) for i in (
+        yardstick.ops.modder.plan_parser,
+        yardstick.ops.modder.log_message,
+        yardstick.ops.modder.digest,
+        yardstick.ops.modder.write_atomic,
+        yardstick.ops.modder.file_signature,
+        yardstick.ops.modder.state_load,
+        yardstick.ops.modder.state_save,
+        yardstick.ops.checker.receive_payload,
+        yardstick.ops.checker.Snapshot,
+        yardstick.ops.checker.session_snapshot,
+        yardstick.ops.checker.run_tests,
+        yardstick.ops.checker.class_current,
+        yardstick.ops.checker.run_class,
+        yardstick.ops.checker.checks_update,
+    )])
+
+
+def class_text(class_):
+    """
+    Return the source of a class of tests for a check program.
+
+    The class is given a `sourceHash` attribute by which the target
+    can tell when it has been edited.
+    """
+    import inspect
+    import yardstick.ops.modder
+    rv = textwrap.dedent(inspect.getsource(class_))
+    return "{0}\n{1}.sourceHash = {2!r}\n".format(
+        rv, class_.__name__, yardstick.ops.modder.digest(rv)
+    )
+
+
+def check_program(class_):
+    """
+    Generate the source of a program which runs a class of tests.
+
+    The program imports only those modules its source names.
+    """
+    import inspect
+    import yardstick.ops.checker
+    checkLines, nr = inspect.getsourcelines(
+        yardstick.ops.checker.check
+    )
+    checkLines[0] = 'if __name__ == "__channelexec__":\n'
+    return program_text("\n".join((
+        class_text(class_),
+        helpers_text(),
+        "".join(checkLines).replace("class_", class_.__name__)
+    )))
+
+
+def bundle_program(classes):
+    """
+    Generate the source of a program which runs several classes of
+    tests in one remote interpreter.
+
+    """
+    import inspect
+    import yardstick.ops.checker
+    return program_text("\n".join(
+        ["bundle = []", ""] +
+        [
+            "{0}bundle.append({1})\n".format(
+                class_text(class_), class_.__name__
+            )
+            for class_ in classes
+        ] +
+        [
+            helpers_text(),
+            inspect.getsource(yardstick.ops.checker.check_all),
+            'if __name__ == "__channelexec__":',
+            "    check_all(bundle)",
+            ""
+        ]
+    ))
+
+
+def cached_program(classes, path=DFLT_CACHE, bundle=False):
+    """
+    Return a program for some classes of tests, from the cache if
+    possible.
+
+    The cache is keyed by a hash of the source files which go into the
+    program, so an entry goes stale as soon as any of them is edited.
+
+    :param classes: A sequence of test classes.
+    :param bundle: If True, make one program to run all the classes.
+        Otherwise `classes` must hold exactly one.
+    """
+    import hashlib
+    import inspect
+    import yardstick.ops.checker
+    import yardstick.ops.modder
+    generate = (
+        (lambda: bundle_program(classes)) if bundle
+        else (lambda: check_program(classes[0]))
+    )
+    try:
+        hash_ = hashlib.sha256(str(bundle).encode("utf-8"))
+        for class_ in classes:
+            hash_.update(
+                "{0.__module__}.{0.__qualname__}".format(class_).encode("utf-8")
+            )
+        for fP in sorted({inspect.getfile(i) for i in classes}) + [
+            yardstick.ops.checker.__file__,
+            yardstick.ops.modder.__file__,
+            __file__,
+        ]:
+            with open(fP, 'rb') as src:
+                hash_.update(src.read())
+        fP = os.path.join(path, "programs", hash_.hexdigest() + ".py")
+    except (OSError, TypeError):
+        return generate()
 
-    for class_ in testClasses:
-        checkLines, nr = inspect.getsourcelines(
-            yardstick.ops.checker.check
-        )
-        checkLines[0] = 'if __name__ == "__channelexec__":\n'
-        text = "\n".join((
-            yardstick.ops.checker.shebang,
-            "\n".join("import {}".format(i)
-                      for i in yardstick.ops.checker.imports),
-            "",
-            inspect.getsource(class_),
-            inspect.getsource(yardstick.ops.modder.config_parser),
-            inspect.getsource(yardstick.ops.modder.config_settings),
-            inspect.getsource(yardstick.ops.modder.log_message),
-            "".join(checkLines).replace("class_", class_.__name__)
+    try:
+        with open(fP, 'r') as cached:
+            return cached.read()
+    except OSError:
+        pass
+
+    rv = generate()
+    try:
+        os.makedirs(os.path.dirname(fP), exist_ok=True)
+        yardstick.ops.modder.write_atomic(fP, rv)
+    except OSError:
+        pass
+    return rv
+
+
+def gen_check_tasks(args):
+    import unittest
+    import yardstick.ops.units
+    if getattr(args, "include", None) or getattr(args, "exclude", None):
+        testClasses = set(yardstick.ops.units.gen_test_classes(
+            yardstick.ops.units.query(args, plugins=False)
         ))
-        yield text
+    else:
+        ldr = unittest.defaultTestLoader
+        testClasses = {
+            type(meth)
+            for i in args.modules + args.paths
+            for mod in ldr.discover(i)
+            for suite in mod for meth in suite
+        }
+
+    testClasses = sorted(
+        testClasses, key=lambda x: (x.__module__, x.__qualname__)
+    )
+    if getattr(args, "bundle", False):
+        if testClasses:
+            yield cached_program(testClasses, bundle=True)
+    else:
+        for class_ in testClasses:
+            yield cached_program([class_])
+
+
+def gen_steps(plan):
+    """
+    Group the sections of a plan into steps of dispatch.
+
+    Consecutive remote sections which declare the same `group` form
+    a stage; the target may run those concurrently. Every other
+    section is a step of its own, and keeps strict order.
+
+    :returns: A generator of section numbers and lists of them.
+    """
+    stage = []
+    group = None
+    for n, section in enumerate(plan["sections"]):
+        if section.get("action") == "local":
+            label = None
+        else:
+            label = section.get("group")
 
+        if stage and label != group:
+            yield stage
+            stage = []
 
-def loop_over_lockstep(channel, name, ini):
+        group = label
+        if group:
+            stage.append(n)
+        else:
+            yield n
+
+    if stage:
+        yield stage
+
+
+def operate_local(section, name, sudoPwd=None, host=None, levels=None):
+    """
+    Perform a local section of a plan on the controller.
+
+    :param host: The host being operated. A `port` probe of a Wait
+        section which names no host is directed at it.
+    :param levels: A Counter of logging levels, updated with those of
+        the records the operation produces.
+    :returns: The Counter of logging levels.
+    """
+    import yardstick.ops.modder
     log = logging.getLogger(name)
+    rv = collections.Counter() if levels is None else levels
+    Op = {
+        i.__name__: i for i in (
+            yardstick.ops.modder.Command,
+            yardstick.ops.modder.Text,
+            yardstick.ops.modder.Wait
+        )
+    }.get(section.get("type"), None)
+    if section["error"] or Op is None:
+        log.error("Bad parameters")
+        rv[logging.ERROR] += 1
+        return rv
+
+    kwargs = dict(section["arguments"])
+    if Op is yardstick.ops.modder.Wait:
+        kwargs["probe"] = target_probe(kwargs.get("probe"), host)
+    op = Op(**kwargs)
+    for msg in op(sudo=section["sudo"], sudoPwd=sudoPwd):
+        for record in gen_records(msg):
+            rv[record.levelno] += 1
+            log.handle(record)
+    return rv
 
-    for n, sName in enumerate(ini.sections()):
-        log.debug(sName)
-        if ini.get(sName, "action", fallback="remote") == "local":
+
+def loop_over_lockstep(
+    channel, name, plan, sudoPwd=None, window=1, span=None, host=None
+):
+    """
+    Dispatch the sections of a plan to the `lockstep` program.
+
+    Up to `window` remote steps are sent ahead of their
+    acknowledgement by the target. A local section waits until all
+    the remote ones before it are complete. No more sections are
+    dispatched once one has logged an error.
+
+    :param span: A range of the section numbers to dispatch, or None
+        for all of them.
+    :param host: The host being operated.
+    :returns: The number of sections completed without error.
+    """
+    log = logging.getLogger(name)
+    levels = collections.Counter()
+    pending = collections.deque()
+    rv = 0
+
+    def errors():
+        return sum(v for k, v in levels.items() if k >= logging.ERROR)
+
+    def complete():
+        step = pending.popleft()
+        loop_over_logrecords(channel, name, step, levels)
+        if errors():
+            return 0
+        else:
+            return len(step) if isinstance(step, list) else 1
+
+    for step in gen_steps(plan):
+        if errors():
+            break
+
+        n = step[0] if isinstance(step, list) else step
+        if span is not None and n not in span:
+            continue
+
+        section = plan["sections"][n]
+        log.debug(section["name"])
+        if section.get("action") == "local":
             log.debug("Section {} needs local action.".format(n))
-            section = ini[sName]
-            sudo = section.getboolean("sudo", fallback=False)
-            typ = section.get("type", fallback=None)
-            Op = {
-                i.__name__: i for i in (
-                    yardstick.ops.modder.Command,
-                    yardstick.ops.modder.Text
-                )
-            }.get(typ, None)
-            if any(i is None for i in (sudo, typ, Op)):
-                log.error("Bad parameters")
-            else:
-                op = Op(**Op.arguments(**section))
-                for msg in op(sudo=sudo, sudoPwd=sudoPwd):
-                    log.handle(msg)
-                channel.send(n)
+            while pending:
+                rv += complete()
+            if errors():
+                break
+
+            operate_local(section, name, sudoPwd, host, levels)
+            rv += int(not errors())
 
         else:
-            channel.send(n)
-            loop_over_logrecords(channel, name, n)
+            channel.send(step)
+            pending.append(step)
+            while len(pending) >= max(1, window):
+                rv += complete()
+
+    while pending:
+        rv += complete()
 
     channel.send(None)
-    return len(ini.sections())
+    return rv
+
+
+def gen_records(msg):
+    """
+    Expand a message from the target into log records.
+
+    :param msg: A compact record as made by
+        :py:func:`yardstick.ops.modder.log_message`, a list of them as
+        sent by :py:class:`yardstick.ops.modder.Batch`, or the
+        attribute dictionary of a `logging.LogRecord`.
+    :raises ValueError: If `msg` is none of these.
+    """
+    if isinstance(msg, list):
+        for item in msg:
+            yield from gen_records(item)
+    elif isinstance(msg, tuple) and len(msg) == 4:
+        name, levelno, text, created = msg
+        rv = logging.makeLogRecord({
+            "name": name, "msg": text,
+            "levelno": levelno, "levelname": logging.getLevelName(levelno),
+        })
+        rv.created = created
+        rv.msecs = (created - int(created)) * 1000
+        yield rv
+    elif isinstance(msg, dict) and "levelno" in msg:
+        yield logging.makeLogRecord(msg)
+    else:
+        raise ValueError(msg)
 
 
-def loop_over_logrecords(channel, name, sentinel=None):
+def loop_over_logrecords(channel, name, sentinel=None, levels=None):
+    """
+    Log the records sent by the target until `sentinel` arrives.
+
+    :param levels: An optional counter which is updated with the
+        level of every record received.
+    :returns: The last message before the sentinel.
+    """
     log = logging.getLogger(name)
 
     prev = msg = channel.receive()
     while not msg == sentinel:
         try:
-            record = logging.makeLogRecord(msg)
-            log.handle(record)
+            for record in gen_records(msg):
+                log.handle(record)
+                if levels is not None:
+                    levels[record.levelno] += 1
         except:
             log.debug(msg)
         finally:
@@ -179,53 +554,175 @@ def loop_over_logrecords(channel, name, sentinel=None):
     return prev
 
 
-def operate(code, config, args, sudoPwd, name="yardstick"):
-    log = logging.getLogger(name)
+def plan_of(config):
+    """
+    Return the plan of a configuration.
+
+    :param config: A plan as made by
+        :py:func:`yardstick.ops.modder.compile_plan`, or the text of
+        a configuration to compile.
+    """
+    if not isinstance(config, str):
+        return config
 
+    import yardstick.ops.modder
     ini = yardstick.ops.modder.config_parser()
     ini.read_string(config)
-    settings = yardstick.ops.modder.config_settings(ini)
+    return yardstick.ops.modder.compile_plan(ini)
+
+
+class Session:
+    """
+    A gateway to one host, over which any number of programs may run.
+
+    The gateway opens on entering the context and closes on exit. Each
+    program gets a fresh channel, and the payload of plan, arguments,
+    sudo password and timestamp is assembled just once per session.
+
+    :param config: A plan as made by
+        :py:func:`yardstick.ops.modder.compile_plan`, or the text of
+        a configuration to compile.
+    """
+
+    def __init__(self, config, args, sudoPwd, name="yardstick"):
+        self.plan = plan_of(config)
+        self.args = args
+        self.sudoPwd = sudoPwd
+        self.name = name
+        self.payload = (
+            self.plan,
+            {k: v for k, v in vars(args).items() if not isinstance(v, list)},
+            sudoPwd,
+            time.time()
+        )
+        self.spec = None
+        self.gateway = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def open(self):
+        import execnet
+        import ipaddress
+        log = logging.getLogger(self.name)
+        settings = self.plan["settings"]
+
+        if self.args.forget:
+            if self.args.host:
+                forget_host(self.args.host)
+            else:
+                host = ipaddress.ip_interface(settings["admin.net"])
+                forget_host(host.ip.compressed)
+                forget_host(host.ip.exploded)
 
-    if args.forget:
-        host = ipaddress.ip_interface(settings["admin.net"])
-        forget_host(host.ip.compressed)
-        forget_host(host.ip.exploded)
+        self.spec = execnet_string(self.plan, self.args)
+        log.debug(self.spec)
+        if self.spec.startswith("popen"):
+            log.warning("Local invocation.")
 
-    rv = None
-    s = execnet_string(ini, args)
-    log.debug(s)
-    if s.startswith("popen"):
-        log.warning("Local invocation.")
+        if self.args.debug:
+            os.environ["EXECNET_DEBUG"] = "2"
 
-    if args.debug:
-        os.environ["EXECNET_DEBUG"] = "2"
+        try:
+            self.gateway = execnet.makegateway(self.spec)
+        except (BrokenPipeError, execnet.HostNotFound):
+            log.error(
+                "Unable to connect to host: "
+                "Check your hypervisor and/or networking."
+            )
+        return self.gateway
+
+    def close(self):
+        if self.gateway is not None:
+            self.gateway.exit()
+            self.gateway = None
+
+    def start(self, code):
+        """
+        Execute `code` on the target and send it the payload.
+
+        :returns: The channel to the running program.
+        """
+        if self.gateway is None:
+            return None
+
+        ch = self.gateway.remote_exec(code)
+        for obj in self.payload:
+            ch.send(obj)
+        return ch
+
+    def finish(self, channel, code, span=None):
+        """
+        Process the messages from a running program until it completes.
+
+        :param span: A range of the section numbers for the `lockstep`
+            program to perform, or None for all of them.
+
+        :returns: The number of tasks completed by the `lockstep`
+            program, or else the final message from a check program.
+        """
+        import yardstick.ops.modder
+        log = logging.getLogger(self.name)
+        rv = None
+        if channel is None:
+            return rv
+
+        try:
+            if code is yardstick.ops.modder:
+                rv = loop_over_lockstep(
+                    channel, self.name, self.plan, self.sudoPwd,
+                    getattr(self.args, "window", 1), span,
+                    target_host(self.plan, self.args)
+                )
+            else:
+                rv = loop_over_logrecords(channel, self.name)
+
+        except (EOFError, OSError) as e:
+            log.error(self.spec)
+        except Exception as e:
+            log.error(getattr(e, "args", e) or e)
 
-    try:
-        gw = execnet.makegateway(s)
-    except BrokenPipeError:
-        log.error(
-            "Unable to connect to host: "
-            "Check your hypervisor and/or networking."
-        )
         return rv
 
-    try:
-        ch = gw.remote_exec(code)
-        ch.send(config)
-        ch.send({k: v for k, v in vars(args).items() if not isinstance(v, list)})
-        ch.send(sudoPwd)
-        ch.send(time.time())
-
-        if code is yardstick.ops.modder:
-            rv = loop_over_lockstep(ch, name, ini)
-        else:
-            rv = loop_over_logrecords(ch, name)
+    def run(self, code, span=None):
+        """
+        Run one program to completion.
 
-    except (EOFError, OSError) as e:
-        log.error(s)
-    except Exception as e:
-        log.error(getattr(e, "args", e) or e)
-    finally:
-        gw.exit()
+        :param span: A range of the section numbers for the `lockstep`
+            program to perform, or None for all of them.
+        """
+        try:
+            return self.finish(self.start(code), code, span)
+        except (EOFError, OSError) as e:
+            logging.getLogger(self.name).error(self.spec)
 
-    return rv
+    def run_many(self, codes):
+        """
+        Run several programs on the target at once.
+
+        Every program is started before any result is read. Their
+        records are logged one channel at a time.
+
+        :returns: A list of results in the order of `codes`.
+        """
+        codes = list(codes)
+        try:
+            channels = [self.start(code) for code in codes]
+        except (EOFError, OSError) as e:
+            logging.getLogger(self.name).error(self.spec)
+            return [None] * len(codes)
+        return [self.finish(ch, code) for ch, code in zip(channels, codes)]
+
+
+def operate(code, config, args, sudoPwd, name="yardstick"):
+    """
+    Open a session to run just one program.
+
+    """
+    with Session(config, args, sudoPwd, name) as session:
+        return session.run(code)
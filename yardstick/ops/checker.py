@@ -16,12 +16,22 @@
 # You should have received a copy of the GNU General Public License
 # along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import configparser
+import fcntl
+import json
 import logging
+import os
 import platform
+import sys
+import threading
+import traceback
+import types
 import unittest
 
 
+CHECKS_PATH = os.path.join("~", ".yardstick", "checks.json")
+
 shebang = """
 #!/usr/bin/env python3
 # encoding: UTF-8
@@ -29,22 +39,446 @@ shebang = """
 """.lstrip()
 
 imports = [
-    "ast", "collections", "collections.abc", "csv", "configparser", "ctypes",
-    "datetime", "difflib", "errno", "filecmp", "functools", "glob", "grp",
-    "gzip", "hashlib", "html", "inspect", "io", "ipaddress", "itertools",
-    "json", "linecache", "locale", "logging", "os", "pathlib", "platform",
-    "posix", "random", "re", "resource", "shlex", "shutil", "signal", "site",
-    "string", "struct", "stat", "subprocess", "sys", "sysconfig", "syslog",
-    "tarfile", "tempfile", "time", "timeit", "types", "textwrap",
-    "unicodedata", "uuid", "unittest", "venv", "warnings", "xml", "zipfile",
-    "zlib"
+    "ast", "collections", "collections.abc", "concurrent.futures", "csv",
+    "configparser", "ctypes",
+    "datetime", "difflib", "errno", "fcntl", "filecmp", "functools", "glob",
+    "grp", "gzip", "hashlib", "html", "importlib", "inspect", "io", "ipaddress",
+    "itertools", "json", "linecache", "locale", "logging", "os", "pathlib",
+    "platform", "posix", "random", "re", "resource", "shlex", "shutil",
+    "signal", "site", "string", "struct", "stat", "subprocess", "sys",
+    "sysconfig", "syslog", "tarfile", "tempfile", "threading", "time",
+    "timeit", "traceback", "types", "textwrap", "unicodedata", "uuid",
+    "unittest", "venv", "warnings", "xml", "zipfile", "zlib"
 ]
 
 
+def lazy_import(name):
+    """
+    Return a stand-in for a module which is imported on first use.
+
+    Check programs bind this to any module of `imports` which their
+    source does not name, in case a test refers to it dynamically.
+
+    :requires: `importlib`, `types`.
+    """
+    class Module(types.ModuleType):
+
+        def __getattr__(self, attr):
+            mod = importlib.import_module(self.__name__)
+            try:
+                rv = getattr(mod, attr)
+            except AttributeError:
+                rv = importlib.import_module(
+                    "{}.{}".format(self.__name__, attr)
+                )
+            setattr(self, attr, rv)
+            return rv
+
+    return Module(name)
+
+
+def receive_payload():
+    """
+    Receive the plan, arguments, sudo password and timestamp which
+    the controller sends to every program.
+
+    The sections of the plan are already resolved. Tests see them as
+    a parser which does no interpolation.
+
+    :returns: A tuple of (ini, settings, args, sudoPwd, ts).
+    """
+    plan = channel.receive()
+    ini = plan_parser(plan)
+    settings = plan["settings"]
+    args = channel.receive()
+    sudoPwd = channel.receive()
+    ts = channel.receive()
+    return (ini, settings, args, sudoPwd, ts)
+
+
+def run_tests(class_, failfast=False, workers=1):
+    """
+    Run the tests of a class, concurrently if there is more than
+    one worker.
+
+    Concurrent tests share a pool of threads, which suits those which
+    wait on files or processes. Class fixtures run once only.
+
+    :returns: A `unittest.TestResult`.
+    :requires: `concurrent.futures`, `threading`, `traceback`, `unittest`.
+    """
+    ldr = unittest.defaultTestLoader
+    suite = ldr.loadTestsFromTestCase(class_)
+    if workers <= 1:
+        runner = unittest.TextTestRunner(
+            resultclass=unittest.TestResult,
+            failfast=failfast,
+        )
+        return runner.run(suite)
+
+    rv = unittest.TestResult()
+    skip = getattr(class_, "__unittest_skip__", False)
+    try:
+        if not skip:
+            class_.setUpClass()
+    except Exception:
+        rv.errors.append((suite, traceback.format_exc()))
+        return rv
+
+    lock = threading.Lock()
+    owner = threading.get_ident()
+    snapshot = getattr(class_, "snapshot", None)
+
+    def run(test):
+        if rv.shouldStop:
+            return
+        rlt = unittest.TestResult()
+        if snapshot is not None:
+            snapshot.join(owner)
+        try:
+            test(rlt)
+        finally:
+            if snapshot is not None:
+                snapshot.leave()
+        with lock:
+            for a in (
+                "errors", "failures", "skipped",
+                "expectedFailures", "unexpectedSuccesses"
+            ):
+                getattr(rv, a).extend(getattr(rlt, a))
+            rv.testsRun += rlt.testsRun
+            if failfast and (rlt.errors or rlt.failures):
+                rv.stop()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            list(pool.map(run, suite))
+    finally:
+        try:
+            if not skip:
+                class_.tearDownClass()
+        except Exception:
+            rv.errors.append((suite, traceback.format_exc()))
+    return rv
+
+
+class Snapshot:
+    """
+    Reads files on the target once per run, for all the tests
+    which look at them.
+
+    Entries are keyed by path and checked against the file's
+    modification time, so a file which changes is read again.
+
+    While recording, a snapshot notes every file it serves. With
+    `audit` set, it also notes the files opened, listed or looked up
+    with `os.stat`, as by `os.path.isfile`, and the commands run by
+    any other means.
+
+    Records are kept per thread, so that programs which share the
+    snapshot, or the interpreter, do not see each other's activity.
+    The files of the import system and of yardstick's own state are
+    left out.
+
+    :requires: `os`, `sys`, `threading`.
+    """
+
+    events = ("os.exec", "os.posix_spawn", "os.spawn", "os.system")
+
+    def __init__(self, audit=False):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._records = {}
+        self.audit = audit and hasattr(sys, "addaudithook")
+        if self.audit:
+            sys.addaudithook(self._audit)
+
+    @staticmethod
+    def ignored(path):
+        """
+        Decide if a file is none of the business of a test.
+
+        """
+        if "__pycache__" in path.split(os.sep) or path.endswith(".pyc"):
+            return True
+        if path.endswith((".py", ".so")) and any(
+            path.startswith(os.path.join(i, ""))
+            for i in {sys.prefix, sys.base_prefix, sys.exec_prefix}
+        ):
+            return True
+        return path.startswith(os.path.join(
+            os.path.dirname(os.path.expanduser(CHECKS_PATH)), ""
+        ))
+
+    def _note(self, path):
+        record = self._records.get(threading.get_ident())
+        if record is None:
+            return
+        try:
+            path = os.path.abspath(os.fsdecode(path))
+        except TypeError:
+            return
+        if not Snapshot.ignored(path):
+            record[0].add(path)
+
+    @staticmethod
+    def tracer(func):
+        """
+        Wrap a function of `os` so that it notes its path argument
+        in every snapshot which is recording.
+
+        The wrapper is installed once in a process, and shared by the
+        snapshots of all programs running there.
+        """
+        def traced(path, *args, **kwargs):
+            for snapshot in traced.snapshots.copy():
+                snapshot._note(path)
+            return func(path, *args, **kwargs)
+
+        traced.snapshots = set()
+        return traced
+
+    def _audit(self, event, args):
+        record = self._records.get(threading.get_ident())
+        if record is None:
+            return
+        if event == "open" and isinstance(args[0], (str, bytes)):
+            self._note(args[0])
+        elif event in ("os.listdir", "os.scandir"):
+            self._note("." if args[0] is None else args[0])
+        elif event == "subprocess.Popen":
+            record[1].add(str(args[1]))
+        elif event in Snapshot.events:
+            record[1].add(str(args[0]))
+
+    def _entry(self, path):
+        self._note(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is None or entry["key"] != key:
+                with open(path, 'r') as file_:
+                    text = file_.read()
+                entry = {"key": key, "stat": st, "text": text}
+                self._cache[path] = entry
+            return entry
+
+    def stat(self, path):
+        """
+        :returns: The `os.stat_result` of the file when it was read.
+        """
+        return self._entry(path)["stat"]
+
+    def text(self, path):
+        """
+        :returns: The contents of the file as a string.
+        """
+        return self._entry(path)["text"]
+
+    def lines(self, path):
+        """
+        :returns: A tuple of the lines of the file, with their endings.
+        """
+        entry = self._entry(path)
+        with self._lock:
+            if "lines" not in entry:
+                entry["lines"] = tuple(entry["text"].splitlines(True))
+            return entry["lines"]
+
+    def record(self):
+        """
+        Start a new record of the files and commands which tests use
+        in the calling thread.
+
+        :returns: The identity of the record, for other threads to
+            :py:meth:`join`.
+        """
+        rv = threading.get_ident()
+        with self._lock:
+            self._records[rv] = (set(), set())
+            if self.audit:
+                for name in ("stat", "lstat"):
+                    if not hasattr(getattr(os, name), "snapshots"):
+                        setattr(os, name, Snapshot.tracer(getattr(os, name)))
+                    getattr(os, name).snapshots.add(self)
+        return rv
+
+    def join(self, owner):
+        """
+        Add what the calling thread uses to the record of `owner`,
+        if there is one.
+
+        """
+        with self._lock:
+            if owner in self._records:
+                self._records[threading.get_ident()] = self._records[owner]
+
+    def leave(self):
+        """
+        Stop adding to a record from the calling thread.
+
+        """
+        with self._lock:
+            self._records.pop(threading.get_ident(), None)
+
+    def recorded(self):
+        """
+        Stop recording in the calling thread.
+
+        :returns: A tuple of the sets of files and commands used since
+            recording began.
+        """
+        with self._lock:
+            rv = self._records.pop(threading.get_ident(), (set(), set()))
+            if not self._records:
+                for name in ("stat", "lstat"):
+                    getattr(getattr(os, name), "snapshots", set()).discard(
+                        self
+                    )
+        return rv
+
+
+def session_snapshot(ts, audit=False):
+    """
+    Return the snapshot shared by every program of a session.
+
+    The programs of a session run in one interpreter on the target,
+    each in a namespace of its own. The snapshot is kept in a module
+    of that interpreter, under the timestamp of the session, so that
+    each file is read once however the classes are split up.
+
+    :param ts: The timestamp of the session.
+    :requires: `sys`, `threading`, `types`.
+    """
+    shared = sys.modules.setdefault(
+        "yardstick_session", types.ModuleType("yardstick_session")
+    )
+    lock = vars(shared).setdefault("lock", threading.Lock())
+    with lock:
+        rv = vars(shared).get("snapshots", {}).get(ts)
+        if rv is None:
+            rv = Snapshot(audit=audit)
+            shared.snapshots = {ts: rv}
+    return rv
+
+
+def class_current(entry, fingerprint):
+    """
+    Decide if a class of tests may be passed from a record of its
+    previous run.
+
+    :param entry: The record of the previous run, or None.
+    :param fingerprint: A hash of the class source and settings.
+    :returns: True if the class passed last time, and neither it
+        nor any of the files it read have changed since.
+    :requires: `hashlib`, `os`.
+    """
+    if not entry or entry.get("fingerprint") != fingerprint:
+        return False
+    return all(
+        file_signature(path, prior) == prior
+        for path, prior in entry.get("files", {}).items()
+    )
+
+
+def run_class(
+    class_, ini, settings, args, sudoPwd, ts, snapshot=None, state=None
+):
+    """
+    Run a class of tests on the target.
+
+    The payload is made available to the tests as class attributes,
+    along with a :py:class:`Snapshot` of the files they read.
+
+    :param state: An optional dictionary of the classes run before.
+        A class which passed, and whose source, settings and files are
+        just as they were, is not run again. Its tests are counted as
+        `cached`. The outcome of this run is stored back under the name
+        of the class. Classes which run commands, or which read no
+        files at all, are never cached.
+    :returns: A dictionary of errors, failures and skipped tests,
+        the total number, and the number of those passed from cache.
+    :requires: `json`.
+    """
+    class_.ini = ini
+    class_.settings = settings
+    class_.args = args
+    class_.sudoPwd = sudoPwd
+    class_.ts = ts
+    class_.snapshot = snapshot or Snapshot(audit=state is not None)
+
+    if state is not None:
+        fingerprint = digest(json.dumps(
+            [getattr(class_, "sourceHash", None), settings], sort_keys=True
+        ))
+        entry = state.get(class_.__name__)
+        if class_current(entry, fingerprint):
+            return {
+                "errors": [], "failures": [],
+                "skipped": entry.get("skipped", []),
+                "total": entry["total"], "cached": entry["total"]
+            }
+        class_.snapshot.record()
+
+    rlt = run_tests(
+        class_, args.get("failfast", False), args.get("workers", 1) or 1
+    )
+
+    rv = {
+        a: [i[1] for i in getattr(rlt, a)]
+        for a in ("errors", "failures", "skipped")
+    }
+    rv["total"] = rlt.testsRun
+    rv["cached"] = 0
+
+    if state is not None:
+        files, commands = class_.snapshot.recorded()
+        if rlt.wasSuccessful() and files and not commands:
+            state[class_.__name__] = {
+                "fingerprint": fingerprint,
+                "files": {i: file_signature(i) for i in sorted(files)},
+                "skipped": rv["skipped"],
+                "total": rv["total"],
+            }
+        else:
+            state[class_.__name__] = None
+    return rv
+
+
+def checks_update(state, names, path=CHECKS_PATH):
+    """
+    Store the outcomes of some classes in the record on the target.
+
+    The record is read again before it is written, under a lock, so
+    that programs which check other classes at the same time keep
+    their entries.
+
+    :param state: A dictionary of outcomes by class name.
+    :param names: The names of the classes this program ran.
+    :requires: `fcntl`.
+    """
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        rv = state_load(path)
+        for name in names:
+            if state.get(name):
+                rv[name] = state[name]
+            else:
+                rv.pop(name, None)
+        state_save(rv, path)
+    return rv
+
+
 def check(class_):
     """
     Executed on the target by the `check` command.
 
+    The class reads files through the :py:func:`session_snapshot`, so
+    that programs of the same session need not read them again.
+
     :param class_: A class of tests.
     :type class_: unittest.TestCase
     :requires: `platform`, `unittest`.
@@ -57,37 +491,81 @@ def check(class_):
             name=logName)
         channel.send(msg)
 
-        config = channel.receive()
-        try:
-            class_.ini = config_parser()
-            class_.ini.read_string(config)
-            class_.settings = config_settings(class_.ini)
-        except Exception as e:
-            class_.ini = None
-            class_.settings = {}
-            channel.send(config)
-            channel.send(str(getattr(e, "args", e) or e))
-
-        class_.args = channel.receive()
-        class_.sudoPwd = channel.receive()
-        class_.ts = channel.receive()
-
-        ldr = unittest.defaultTestLoader
-        suite = ldr.loadTestsFromTestCase(class_)
-        runner = unittest.TextTestRunner(
-            resultclass=unittest.TestResult,
-            failfast=class_.args.get("failfast", False),
-        )
-        rlt = runner.run(suite)
+        payload = receive_payload()
+        state = state_load(CHECKS_PATH) if payload[2].get(
+            "incremental"
+        ) else None
+        snapshot = session_snapshot(payload[-1], audit=state is not None)
+        rv = run_class(class_, *payload, snapshot=snapshot, state=state)
+        if state is not None:
+            checks_update(state, [class_.__name__])
+
+        msg = log_message(
+            logging.INFO,
+            msg="Check cached." if rv["cached"] else "Check complete.",
+            name=logName)
+        channel.send(msg)
+        channel.send(rv)
+    except (EOFError, OSError) as e:
+        channel.send(str(getattr(e, "args", e) or e))
+    except Exception as e:
+        channel.send(str(getattr(e, "args", e) or e))
+    finally:
+        channel.send(None)
+
+
+def check_all(classes):
+    """
+    Executed on the target by the `check --bundle` command.
+
+    Runs several classes of tests in one program. The results of each
+    class are sent as it completes, with its name under the key
+    `class`. The combined results of all classes come last.
+    The classes share the :py:func:`session_snapshot` of the files
+    they read.
 
-        msg = log_message(logging.INFO, msg="Check complete.", name=logName)
+    :param classes: A sequence of test classes.
+    :requires: `platform`, `unittest`.
+    """
+    logName = "yardstick.check"
+    try:
+        msg = log_message(
+            logging.INFO,
+            msg="Executing from {}.".format(platform.node()),
+            name=logName)
         channel.send(msg)
 
+        payload = receive_payload()
+        state = state_load(CHECKS_PATH) if payload[2].get(
+            "incremental"
+        ) else None
+        snapshot = session_snapshot(payload[-1], audit=state is not None)
         rv = {
-            a: [i[1] for i in getattr(rlt, a)]
-            for a in ("errors", "failures", "skipped")
+            "errors": [], "failures": [], "skipped": [],
+            "total": 0, "cached": 0
         }
-        rv["total"] = rlt.testsRun
+        rv["classes"] = []
+        for class_ in classes:
+            rlt = run_class(class_, *payload, snapshot=snapshot, state=state)
+            rlt["class"] = class_.__name__
+            msg = log_message(
+                logging.INFO,
+                msg="Check of {} {}.".format(
+                    class_.__name__,
+                    "cached" if rlt["cached"] else "complete"
+                ),
+                name=logName)
+            channel.send(msg)
+            channel.send(rlt)
+
+            for a in ("errors", "failures", "skipped"):
+                rv[a].extend(rlt[a])
+            for a in ("total", "cached"):
+                rv[a] += rlt[a]
+            rv["classes"].append(class_.__name__)
+
+        if state is not None:
+            checks_update(state, rv["classes"])
         channel.send(rv)
     except (EOFError, OSError) as e:
         channel.send(str(getattr(e, "args", e) or e))
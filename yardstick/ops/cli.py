@@ -106,9 +106,40 @@ def add_auto_command_parser(subparsers):
         help="Remove existing host key from the file '{}'".format(
             yardstick.ops.base.KNOWN_HOSTS
         ))
+    rv.add_argument(
+        "--persist", type=int, default=None,
+        help="Keep each SSH connection open for reuse until idle "
+        "for this many seconds")
     rv.add_argument(
         "--debug", action="store_true", default=False,
         help="Print wire-level messages for debugging")
+    rv.add_argument(
+        "--hosts", nargs="*", default=[],
+        help="Specify an inventory of remote hosts to operate concurrently")
+    rv.add_argument(
+        "--width", type=int, default=yardstick.ops.base.DFLT_WIDTH,
+        help="Set the maximum number of hosts to operate at once [{}]".format(
+            yardstick.ops.base.DFLT_WIDTH
+        ))
+    rv.add_argument(
+        "--probes", type=int, default=yardstick.ops.base.DFLT_PROBES,
+        help="Set the maximum number of readiness probes in flight "
+        "across hosts [{}]".format(yardstick.ops.base.DFLT_PROBES))
+    rv.add_argument(
+        "--window", type=int, default=1,
+        help="Set the number of remote tasks to send ahead of completion [1]")
+    rv.add_argument(
+        "--workers", type=int, default=yardstick.ops.base.DFLT_WORKERS,
+        help="Set the number of sections in a stage to run at once "
+        "on the target [{}]".format(yardstick.ops.base.DFLT_WORKERS))
+    rv.add_argument(
+        "--idempotent", action="store_true", default=False,
+        help="Skip sections whose content and target files are unchanged "
+        "since they last ran")
+    rv.add_argument(
+        "--coalesce", action="store_true", default=False,
+        help="Apply consecutive Text sections on the same file "
+        "in a single read and write")
     rv = add_common_options(rv)
     rv.usage = rv.format_usage().replace("usage:", "").replace(
         "auto", "\n\nyardstick [OPTIONS] auto")
@@ -141,12 +172,43 @@ def add_check_command_parser(subparsers):
         help="Remove existing host key from the file '{}'".format(
             yardstick.ops.base.KNOWN_HOSTS
         ))
+    rv.add_argument(
+        "--persist", type=int, default=None,
+        help="Keep each SSH connection open for reuse until idle "
+        "for this many seconds")
     rv.add_argument(
         "--debug", action="store_true", default=False,
         help="Print wire-level messages for debugging")
     rv.add_argument(
         "--failfast", action="store_true", default=False,
         help="Halt checks on the first failure")
+    rv.add_argument(
+        "--bundle", action="store_true", default=False,
+        help="Run all the test classes in a single program on each host")
+    rv.add_argument(
+        "--workers", type=int, default=1,
+        help="Set the number of tests of a class to run at once "
+        "on the target [1]")
+    rv.add_argument(
+        "--incremental", action="store_true", default=False,
+        help="Pass without running those classes which passed before, "
+        "if they and the files they read are unchanged")
+    rv.add_argument(
+        "--include", nargs="*", default=[],
+        help="Check only those classes of --modules and --paths with "
+        "a test which matches one of these patterns (see units)")
+    rv.add_argument(
+        "--exclude", nargs="*", default=[],
+        help="Check only those classes with a test which matches "
+        "none of these patterns")
+    rv.add_argument(
+        "--hosts", nargs="*", default=[],
+        help="Specify an inventory of remote hosts to check concurrently")
+    rv.add_argument(
+        "--width", type=int, default=yardstick.ops.base.DFLT_WIDTH,
+        help="Set the maximum number of checks to run at once [{}]".format(
+            yardstick.ops.base.DFLT_WIDTH
+        ))
     rv = add_common_options(rv)
     rv.usage = rv.format_usage().replace("usage:", "").replace(
         "check", "\n\nyardstick [OPTIONS] check")
@@ -157,6 +219,21 @@ def add_units_command_parser(subparsers):
         "units", help="Find and filter tests by their attributes.",
         description="", epilog="other commands: auto, check"
     )
+    rv.add_argument(
+        "--modules", nargs="*",
+        default=[],
+        help="Specify one or more Python modules to search.")
+    rv.add_argument(
+        "--paths", nargs="*",
+        default=[],
+        help="Specify one or more file paths to search.")
+    rv.add_argument(
+        "--include", nargs="*", default=[],
+        help="Find tests which match any of these patterns, eg: "
+        "'tags=ssh' 'files=/etc/*' 'yardstick.openrc.*'")
+    rv.add_argument(
+        "--exclude", nargs="*", default=[],
+        help="Leave out tests which match any of these patterns")
     rv.usage = rv.format_usage().replace("usage:", "").replace(
         "units", "\n\nyardstick [OPTIONS] units")
     return rv
@@ -18,10 +18,14 @@
 
 
 from collections import OrderedDict
-from collections.abc import MutableMapping
+from collections.abc import Mapping
 from collections.abc import MutableSequence
+import importlib
+import json
+import os
+import os.path
+import sys
 
-import pkg_resources
 
 __doc__ = """
 This module discovers
@@ -31,27 +35,163 @@ This module discovers
 * entry points in installed packages
   eg: "opensshchecks = yardstick.openrc.test_openssl:OpenSSHChecks"
 
+Entry points are listed from package metadata, and the lists are kept
+in a cache file. The cache is valid for as long as the directories of
+`sys.path` are unmodified; installing or removing a distribution
+changes one of them. No plugin is loaded until it is used.
+
 """
 
+DFLT_CACHE = os.path.expanduser(
+    os.path.join("~", ".cache", "yardstick", "entry_points.json")
+)
+
+
+def path_key(paths=None):
+    """
+    Return the modification times of the directories on the Python path.
+
+    The current directory is left out; installations do not go there.
+    """
+    rv = []
+    for path in sys.path if paths is None else paths:
+        if not path:
+            continue
+        try:
+            rv.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            continue
+    return rv
+
+
+def scan(id):
+    """
+    List the entry points in a group from the metadata of installed
+    distributions.
+
+    Falls back to `pkg_resources` where `importlib.metadata`
+    is not available. Neither is imported unless the cache of entry
+    points is out of date.
+
+    :returns: A list of [name, value] pairs.
+    """
+    try:
+        import importlib.metadata as metadata
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        return [
+            [ep.name, "{}:{}".format(ep.module_name, ".".join(ep.attrs))]
+            for ep in pkg_resources.iter_entry_points(id)
+        ]
+
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=id)
+    else:
+        eps = eps.get(id, [])
+    return [[ep.name, ep.value] for ep in eps]
+
+
+def entry_points(id, path=DFLT_CACHE):
+    """
+    Generate the entry points in a group without loading them.
+
+    :param path: The location of the cache file.
+    :returns: A generator of (name, value) pairs, where `value` is the
+        object reference, eg: "yardstick.openrc.test_skel:SkelTests".
+    """
+    key = path_key()
+    try:
+        with open(path, 'r') as input_:
+            cache = json.load(input_)
+    except (OSError, ValueError):
+        cache = {}
+
+    if cache.get("key") != key:
+        cache = {"key": key, "groups": {}}
+
+    if id not in cache["groups"]:
+        import yardstick.ops.modder
+        cache["groups"][id] = scan(id)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            yardstick.ops.modder.write_atomic(path, json.dumps(cache))
+        except OSError:
+            pass
+
+    for name, value in cache["groups"][id]:
+        yield (name, value)
+
+
+def load(value):
+    """
+    Import the object named by an entry point.
+
+    """
+    modName, _, attrs = value.partition(":")
+    rv = importlib.import_module(modName.strip())
+    for attr in filter(None, attrs.strip().split(".")):
+        rv = getattr(rv, attr)
+    return rv
+
+
+class Plugins(Mapping):
+    """
+    A mapping of entry point name to plugin object.
+
+    The group is not read until the mapping is first used, and each
+    plugin is loaded only when it is looked up. A plugin which fails
+    to load raises KeyError.
+
+    """
+
+    def __init__(self, id):
+        self.id = id
+        self._refs = None
+        self._objs = {}
+
+    @property
+    def refs(self):
+        if self._refs is None:
+            self._refs = OrderedDict(entry_points(self.id))
+        return self._refs
+
+    def __getitem__(self, name):
+        if name not in self._objs:
+            try:
+                self._objs[name] = load(self.refs[name])
+            except Exception as e:
+                raise KeyError(name) from e
+        return self._objs[name]
+
+    def __iter__(self):
+        return iter(self.refs)
+
+    def __len__(self):
+        return len(self.refs)
+
+
 def discover(id):
-    for ep in pkg_resources.iter_entry_points(id):
+    plugins = Plugins(id)
+    for name in plugins:
         try:
-            obj = ep.load(require=False)
-        except Exception as e:
+            obj = plugins[name]
+        except KeyError:
             continue
         else:
-            yield (ep.name, obj)
+            yield (name, obj)
 
 
-testcases = OrderedDict(discover("yardstick.plugin.testcase"))
+testcases = Plugins("yardstick.plugin.testcase")
 """This is the collection of all installed test cases.
 """
 
-operations = OrderedDict(discover("yardstick.plugin.operation"))
-"""This is the collection of all installed test cases.
+operations = Plugins("yardstick.plugin.operation")
+"""This is the collection of all installed operations.
 """
 
 if __name__ == "__main__":
     print(*["{:^10} {}".format(k, v) for k, v in globals().items()
-          if isinstance(v, MutableMapping) or
+          if isinstance(v, Mapping) or
           isinstance(v, MutableSequence)], sep="\n")
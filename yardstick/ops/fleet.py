@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+from collections import OrderedDict
+import concurrent.futures
+import logging
+
+import yardstick.ops.base
+
+__doc__ = """
+This module operates an inventory of hosts concurrently.
+
+Each host gets its own session, but no more than `--width` sessions
+are open at any one time.
+
+A local Wait section in a plan is a barrier across the fleet. Every
+host completes the sections before it, and then the controller waits
+for all of them at once. A `port` probe is tested for each host on a
+single event loop, with no more than `--probes` connection attempts in
+flight. Each host has its own deadline, so the fleet is ready as soon
+as its slowest host is. Hosts which never become ready take no part in
+the sections after the barrier. Any other kind of local Wait is
+performed just once for the whole fleet.
+
+Sessions do not last across a barrier. Each host is connected again
+for the phase after it, since the barrier often waits out a reboot
+which would end the session anyway, and since holding every session
+open at the barrier would defeat `--width`.
+
+"""
+
+
+def host_args(args, host):
+    """
+    Return a copy of the command line arguments which targets `host`.
+
+    """
+    return argparse.Namespace(**dict(vars(args), host=host))
+
+
+def host_filter(name, host):
+    """
+    Return a logging filter which tags forwarded records with `host`.
+
+    Records from the target carry their remote logger name. This filter
+    appends the host so that interleaved output can be told apart.
+    """
+    def filter_(record):
+        if not record.name.startswith(name):
+            record.name = "{}@{}".format(record.name, host)
+        return True
+
+    return filter_
+
+
+def host_name(name, host):
+    """
+    Return the name of the logger for one host.
+
+    """
+    rv = "{}.{}".format(name, host)
+    hostLog = logging.getLogger(rv)
+    if not hostLog.filters:
+        hostLog.addFilter(host_filter(rv, host))
+    return rv
+
+
+def operate_host(
+    codes, config, args, sudoPwd, name, parallel=False, span=None
+):
+    """
+    Run a sequence of programs over a single session to one host.
+
+    :param parallel: If True, start all programs at once.
+    :param span: A range of the section numbers to perform.
+    :returns: A list of results, one for each program.
+    """
+    with yardstick.ops.base.Session(config, args, sudoPwd, name) as session:
+        if parallel:
+            return session.run_many(codes)
+        else:
+            return [session.run(code, span) for code in codes]
+
+
+def gen_results(
+    codes, config, args, sudoPwd, name="yardstick", parallel=False,
+    span=None, hosts=None
+):
+    """
+    Run a sequence of programs against every host in `args.hosts`.
+
+    Each host has one session, and there are no more than
+    `args.width` sessions open at once.
+
+    :param span: A range of the section numbers to perform, or None
+        for all of them.
+    :param hosts: The hosts to operate, if not all of `args.hosts`.
+    :returns: A generator of (host, results) pairs in order
+        of completion.
+    """
+    log = logging.getLogger(name)
+    codes = list(codes)
+    width = max(1, args.width or yardstick.ops.base.DFLT_WIDTH)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=width) as pool:
+        jobs = {}
+        for host in OrderedDict.fromkeys(
+            args.hosts if hosts is None else hosts
+        ):
+            job = pool.submit(
+                operate_host, codes, config, host_args(args, host), sudoPwd,
+                host_name(name, host), parallel, span
+            )
+            jobs[job] = host
+
+        for job in concurrent.futures.as_completed(jobs):
+            host = jobs[job]
+            try:
+                results = job.result()
+            except Exception as e:
+                log.error("{}: {}".format(host, getattr(e, "args", e) or e))
+                results = [None] * len(codes)
+            yield (host, results)
+
+
+def gen_phases(plan):
+    """
+    Divide a plan at its local Wait sections.
+
+    :returns: A generator of (span, n) pairs. `span` is the range of
+        section numbers to perform on every host, and `n` the number
+        of the Wait section which follows it, or None at the end.
+    """
+    start = 0
+    for n, section in enumerate(plan["sections"]):
+        if section.get("action") == "local" and section.get("type") == "Wait":
+            yield (range(start, n), n)
+            start = n + 1
+    yield (range(start, len(plan["sections"])), None)
+
+
+async def probe_host(op, host, semaphore, name):
+    """
+    Test a `port` probe against one host until it is met, or the
+    attempts of the Wait operation run out.
+
+    :param op: A :py:class:`yardstick.ops.modder.Wait` operation of
+        this host alone, whose delays set its deadline.
+    :param semaphore: Limits the connection attempts in flight.
+    :returns: True if the probe was met.
+    """
+    import asyncio
+    log = logging.getLogger(name)
+    probe = yardstick.ops.base.target_probe(op.probe, host)
+    address, _, port = probe.partition(":")[2].rpartition(":")
+
+    async def check():
+        async with semaphore:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(address, int(port)), timeout=1
+                )
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            return True
+
+    rv = await check()
+    for pause in op.delays():
+        if rv:
+            break
+        await asyncio.sleep(pause)
+        rv = await check()
+
+    if rv:
+        log.info("Probe {} met.".format(probe))
+    else:
+        log.warning("Probe {} unmet.".format(probe))
+    return rv
+
+
+def wait_fleet(section, hosts, args, sudoPwd, name="yardstick"):
+    """
+    Perform a local Wait section for many hosts at once.
+
+    A `port` probe which names no host is tested against each of
+    `hosts` on one event loop. Any other Wait is performed just once.
+
+    :returns: An ordered mapping of host to True if it is ready.
+    """
+    import yardstick.ops.modder
+    hosts = list(OrderedDict.fromkeys(hosts))
+    kind, _, target = (
+        (section["arguments"] or {}).get("probe") or ""
+    ).partition(":")
+    if section["error"] or kind != "port" or ":" in target:
+        levels = yardstick.ops.base.operate_local(section, name, sudoPwd)
+        ready = not any(levels[i] for i in levels if i >= logging.ERROR)
+        return OrderedDict((host, ready) for host in hosts)
+
+    import asyncio
+
+    async def schedule():
+        semaphore = asyncio.Semaphore(
+            max(1, getattr(args, "probes", None) or
+                yardstick.ops.base.DFLT_PROBES)
+        )
+        return await asyncio.gather(*(
+            probe_host(
+                yardstick.ops.modder.Wait(**section["arguments"]),
+                host, semaphore, host_name(name, host)
+            )
+            for host in hosts
+        ))
+
+    loop = asyncio.new_event_loop()
+    try:
+        return OrderedDict(zip(hosts, loop.run_until_complete(schedule())))
+    finally:
+        loop.close()
+
+
+def operate_fleet(codes, config, args, sudoPwd, name="yardstick"):
+    """
+    Run the `auto` programs against every host in `args.hosts`.
+
+    The plan is performed in phases divided by its local Wait sections.
+    A host which fails in one phase is left out of the rest.
+
+    Every phase opens a new session to each of its hosts, so a plan with
+    `k` barriers connects `k + 1` times to a host. Use `--persist` to
+    let those connections share one SSH transport.
+
+    :param config: A plan as made by
+        :py:func:`yardstick.ops.modder.compile_plan`, or the text of
+        a configuration to compile.
+    :returns: An ordered mapping of host to a list of the values
+        returned by :py:meth:`yardstick.ops.base.Session.run`. A value
+        is None when a host could not be operated.
+    """
+    import yardstick.ops.modder
+    config = yardstick.ops.base.plan_of(config)
+    codes = list(codes)
+    rv = OrderedDict(
+        (host, [0 if code is yardstick.ops.modder else None for code in codes])
+        for host in args.hosts
+    )
+
+    def tally(host, results):
+        rv[host] = [
+            i + j if isinstance(i, int) and isinstance(j, int) else j
+            for i, j in zip(rv[host], results)
+        ]
+
+    def complete(host, n):
+        return all(
+            i == n for i, code in zip(rv[host], codes)
+            if code is yardstick.ops.modder
+        )
+
+    hosts = list(OrderedDict.fromkeys(args.hosts))
+    for span, n in gen_phases(config):
+        if span and hosts:
+            for host, results in gen_results(
+                codes, config, args, sudoPwd, name, span=span, hosts=hosts
+            ):
+                tally(host, results)
+            hosts = [host for host in hosts if complete(host, span.stop)]
+
+        if n is not None and hosts:
+            ready = wait_fleet(
+                config["sections"][n], hosts, args, sudoPwd, name
+            )
+            for host in hosts:
+                if ready[host]:
+                    tally(host, [
+                        1 if code is yardstick.ops.modder else None
+                        for code in codes
+                    ])
+            hosts = [host for host in hosts if ready[host]]
+
+    return rv
+
+
+def check_fleet(programs, config, args, sudoPwd, name="yardstick"):
+    """
+    Run every check program against every host in `args.hosts`.
+
+    The programs for each host share one gateway and run at
+    the same time.
+
+    :returns: An ordered mapping of host to the merged results of
+        all programs on that host.
+    """
+    rv = OrderedDict((host, None) for host in args.hosts)
+    for host, results in gen_results(
+        programs, config, args, sudoPwd, name, parallel=True
+    ):
+        rv[host] = merge_results(results)
+    return rv
+
+
+def merge_results(results):
+    """
+    Combine the results of several checks into one.
+
+    :param results: A sequence of dictionaries as returned by
+        :py:func:`yardstick.ops.checker.check`. Any other object
+        stands for a check which did not complete, and is counted
+        as an error.
+    :returns: A dictionary of the same shape.
+    """
+    rv = {
+        "errors": [], "failures": [], "skipped": [], "total": 0, "cached": 0
+    }
+    for result in results:
+        if isinstance(result, dict):
+            for a in ("errors", "failures", "skipped"):
+                rv[a].extend(result.get(a, []))
+            for a in ("total", "cached"):
+                rv[a] += result.get(a, 0)
+        else:
+            rv["errors"].append(
+                "Incomplete check: {}".format(result or "no result")
+            )
+    return rv
@@ -16,17 +16,18 @@
 # You should have received a copy of the GNU General Public License
 # along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
 
-from getpass import getpass
 import logging
 import sys
 
 import yardstick
-import yardstick.ops.base
 import yardstick.ops.cli
 
 __doc__ = """
 Entry point for the yardstick program.
 
+Modules are imported only by the commands which need them, so that
+`--version` and `--help` return quickly.
+
 """
 
 
@@ -34,23 +35,45 @@ def main(args):
     if args.command is None:
         return 2
 
+    import yardstick.ops.base
     logName = yardstick.ops.base.log_setup(
         args, "yardstick.{}".format(args.command)
     )
     log = logging.getLogger(logName)
 
+    if args.command == "units":
+        import yardstick.ops.units
+        units = yardstick.ops.units.query(args)
+        for unit in units:
+            fields = ["{module}.{class}.{method}".format(**unit)]
+            for a in ("tags", "files"):
+                if unit[a]:
+                    fields.append("{}={}".format(a, ",".join(unit[a])))
+            print(*fields, sep="\t")
+        log.info("{} units found.".format(len(units)))
+        return 0
+
     if sys.stdin in args.ini:
         log.info("Accepting stream input.")
 
+    import yardstick.ops.modder
     config = '\n'.join(i.read() for i in args.ini)
     ini = yardstick.ops.modder.config_parser()
     ini.read_string(config)
-    settings = yardstick.ops.modder.config_settings(ini)
+    plan = yardstick.ops.modder.compile_plan(ini)
+    settings = plan["settings"]
 
-    if any(
-        ini.getboolean(sec, "sudo", fallback=False)
-        for sec in ini.sections()
-    ):
+    if args.command == "auto":
+        faults = [i for i in plan["sections"] if i["error"]]
+        for entry in faults:
+            log.error("Section {name}: {error}".format(**entry))
+        if faults:
+            return 1
+        if args.coalesce:
+            plan = yardstick.ops.modder.coalesce_plan(plan)
+
+    if any(i.get("sudo") for i in plan["sections"]):
+        from getpass import getpass
         sudoPwd = getpass(
             "Enter sudo password for {}:".format(settings["admin.user"]))
     else:
@@ -60,38 +83,88 @@ def main(args):
         ini.write(sys.stdout)
         sys.stdout.write("\n")
 
+    if args.hosts:
+        import yardstick.ops.fleet
+
     rv = 0
     if args.command == "auto":
-        for code in yardstick.ops.base.gen_auto_tasks(args):
-            if args.show:
+        codes = list(yardstick.ops.base.gen_auto_tasks(args))
+        if args.show:
+            for code in codes:
                 print(code)
-            else:
-                nTasks = yardstick.ops.base.operate(
-                    code, config, args, sudoPwd, logName
-                )
-                rv = 0 if nTasks == len(ini.sections()) else 1
+        elif args.hosts:
+            results = yardstick.ops.fleet.operate_fleet(
+                codes, plan, args, sudoPwd, logName
+            )
+            failed = [
+                host for host, rlts in results.items()
+                if any(nTasks != len(plan["sections"]) for nTasks in rlts)
+            ]
+            for host in failed:
+                log.warning("Host {} did not complete.".format(host))
+            log.info("{} of {} hosts complete.".format(
+                len(results) - len(failed), len(results)))
+            rv = 0 if not failed else 1
+        else:
+            with yardstick.ops.base.Session(
+                plan, args, sudoPwd, logName
+            ) as session:
+                for code in codes:
+                    nTasks = session.run(code)
+                    rv = 0 if nTasks == len(plan["sections"]) else 1
+
+    elif args.command == "check" and args.show:
+        for code in yardstick.ops.base.gen_check_tasks(args):
+            print(code)
+
+    elif args.command == "check" and args.hosts:
+        results = yardstick.ops.fleet.check_fleet(
+            yardstick.ops.base.gen_check_tasks(args),
+            plan, args, sudoPwd, logName
+        )
+        for host, result in results.items():
+            print("\n{}".format(host))
+            print(
+                *[i for a in ("skipped", "failures", "errors")
+                    for i in result[a]],
+                sep="\n"
+            )
+            print("Total: {}".format(result["total"]))
+            if result["cached"]:
+                print("Cached: {}".format(result["cached"]))
+
+        summary = yardstick.ops.fleet.merge_results(results.values())
+        print("\n")
+        print(
+            "Hosts: {0}".format(len(results)),
+            *["{0}: {1}".format(a.capitalize(), len(summary[a]))
+              for a in ("skipped", "failures", "errors")],
+            sep="\n"
+        )
+        print("Total: {}".format(summary["total"]))
+        if summary["cached"]:
+            print("Cached: {}".format(summary["cached"]))
+        rv = 1 if summary["failures"] or summary["errors"] else 0
 
     elif args.command == "check":
 
-        for code in yardstick.ops.base.gen_check_tasks(args):
-            if args.show:
-                print(code)
-            else:
-                rv = yardstick.ops.base.operate(
-                    code, config, args, sudoPwd, logName
-                )
-
-            if rv is not None:
-                print("\n")
-                print(
-                    *[i for a in ("skipped", "failures", "errors")
-                        for i in rv[a]],
-                    sep="\n"
-                )
-                print("Total: {}".format(rv["total"]))
-
-    elif args.command == "units":
-        raise NotImplementedError("This feature is not yet available.")
+        with yardstick.ops.base.Session(
+            plan, args, sudoPwd, logName
+        ) as session:
+            for code in yardstick.ops.base.gen_check_tasks(args):
+                rv = session.run(code)
+
+                if rv is not None:
+                    print("\n")
+                    print(
+                        *[i for a in ("skipped", "failures", "errors")
+                            for i in rv[a]],
+                        sep="\n"
+                    )
+                    print("Total: {}".format(rv["total"]))
+                    if rv.get("cached"):
+                        print("Cached: {}".format(rv["cached"]))
+
 
     return rv
 
@@ -16,18 +16,54 @@
 # You should have received a copy of the GNU General Public License
 # along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import concurrent.futures
 import configparser
+import ctypes
+import filecmp
+import functools
+import hashlib
+import json
 import logging
+import mmap
+import os
 import platform
+import queue
+import random
 import subprocess
 import re
+import select
+import shlex
+import socket
+import stat
+import struct
 import textwrap
+import threading
 import time
 import unittest
 
+STATE_PATH = os.path.join("~", ".yardstick", "state.json")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_pattern(pattern, flags=0):
+    """
+    Compile a regular expression just once in a process.
+
+    Every operation in this module gets its patterns from here, so
+    those shared by several sections, or tested repeatedly by a Wait,
+    are compiled only the first time.
+
+    :param pattern: A string, or bytes.
+    :raises re.error: If the pattern is invalid.
+    """
+    return re.compile(pattern, flags)
+
 
 class Text:
 
+    flags = re.DOTALL | re.MULTILINE
+
     @staticmethod
     def arguments(**kwargs):
         rv = {
@@ -36,9 +72,12 @@ class Text:
             "data": kwargs.get("data", ""),
             "indent": int(kwargs.get("indent", "0")),
             "newlines": int(kwargs.get("newlines", "0")),
+            "stream": kwargs.get("stream", "False") == "True",
         }
         if rv["seek"] in ("True", "False"):
-            rv["seek"] = bool(rv["seek"])
+            rv["seek"] = rv["seek"] == "True"
+        else:
+            compile_pattern(rv["seek"], Text.flags)
         return rv
 
     def __init__(
@@ -47,42 +86,116 @@ class Text:
         self._name = name
         self._content = ""
         self._rv = None
+        self.stream = False
+        self.edits = None
         for k, v in kwargs.items():
             setattr(self, k, v)
 
-    def __call__(self, content=None, wd=None, sudo=False, sudoPwd=None):
-        if self.path is not None:
-            try:
-                with open(self.path, 'r') as input_:
-                    self._content = input_.read()
-            except FileNotFoundError:
-                pass
+    def gen_chunks(self, mm, rObj=None, size=1 << 20):
+        """
+        Generate the new content of a file in pieces of no more than
+        `size` bytes, besides the inserted data.
 
-        content = self._content if content is None else content
+        :param mm: The existing content, as a memory map.
+        :param rObj: The compiled `seek` pattern, if there is one.
+        """
+        def gen_slices(start, stop):
+            for i in range(start, stop, size):
+                yield mm[i:min(i + size, stop)]
+
+        data = textwrap.indent(self.data, ' ' * self.indent).encode("utf-8")
+        newlines = b"\n" * self.newlines
+        if rObj is not None:
+            pos = 0
+            for match in rObj.finditer(mm):
+                yield from gen_slices(pos, match.start())
+                yield match.expand(data)
+                pos = match.end()
+            yield from gen_slices(pos, len(mm))
+            yield newlines
+        elif self.seek:
+            yield from gen_slices(0, len(mm))
+            yield b"\n" + data + newlines
+        else:
+            yield data + b"\n" + newlines
+            yield from gen_slices(0, len(mm))
+
+    def edit(self):
+        """
+        Edit the file at `path` without reading it into memory.
+
+        The file is mapped rather than read, and the new content goes
+        straight to a temporary file, so memory use does not grow with
+        the size of the file. The `seek` pattern and `data` are encoded
+        as UTF-8 and matched against bytes, so character classes like
+        `\\w` match ASCII only.
+        """
+        with open(self.path, 'rb') as input_, mmap.mmap(
+            input_.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            rObj = None
+            if isinstance(self.seek, str):
+                rObj = compile_pattern(self.seek.encode("utf-8"), Text.flags)
+                match = rObj.search(mm)
+                if match is None:
+                    yield log_message(
+                        logging.WARNING,
+                        msg="Pattern {} unmatched.".format(self.seek),
+                        name=self._name)
+                    yield log_message(
+                        logging.INFO, msg="{} unchanged.".format(self.path),
+                        name=self._name)
+                    return
+
+                start, end = match.span()
+                preview = mm[start:min(end, start + 80)]
+                yield log_message(
+                    logging.DEBUG,
+                    msg="Pattern {} matched bytes {}-{}: {}{}".format(
+                        self.seek, start, end,
+                        preview.decode("utf-8", errors="replace"),
+                        "..." if end - start > 80 else ""),
+                    name=self._name)
+
+            changed = write_atomic(
+                self.path, self.gen_chunks(mm, rObj), keep=True
+            )
+
+        yield log_message(
+            logging.INFO,
+            msg="{} {}.".format(
+                self.path, "changed" if changed else "unchanged"),
+            name=self._name)
+
+    def apply(self, content):
+        """
+        Compute the new content of the file from its old content.
+
+        No file is read or written. Log messages are yielded as they
+        arise; the new content is the return value of the generator.
+        """
         if isinstance(self.seek, str):
-            rObj = re.compile(self.seek, re.DOTALL | re.MULTILINE)
+            rObj = compile_pattern(self.seek, Text.flags)
             match = rObj.search(content)
             if match:
                 tgt = match.string[match.start():match.end()]
-                msg = log_message(
+                yield log_message(
                     logging.DEBUG,
                     msg="Pattern {} matched {}".format(
                         rObj.pattern, tgt),
                     name=self._name)
-                self._rv = "\n".join(
+                return "\n".join(
                     [rObj.sub(textwrap.indent(self.data, ' ' * self.indent),
                      content, count=0)] +
                     [""] * self.newlines
                 )
             else:
-                msg = log_message(
+                yield log_message(
                     logging.WARNING,
                     msg="Pattern {} unmatched.".format(
                         rObj.pattern),
                     name=self._name)
-                self._rv = ""
-
-            yield msg
+                return content
 
         elif self.seek:
             args = (
@@ -90,20 +203,66 @@ class Text:
                 [textwrap.indent(self.data, ' ' * self.indent)] +
                 [""] * self.newlines
             )
-            self._rv = "\n".join(args)
+            return "\n".join(args)
         else:
             args = (
                 [textwrap.indent(self.data, ' ' * self.indent)] +
                 [""] * self.newlines + [content]
             )
-            self._rv = "\n".join(args)
+            return "\n".join(args)
+
+    def __call__(self, content=None, wd=None, sudo=False, sudoPwd=None):
+        """
+        Compute the new content of the file, and write it only if it
+        differs from what is there already.
+
+        The file is replaced atomically, so readers never see it
+        partly written. In `stream` mode, an existing file which is
+        not empty is edited by :py:meth:`edit`.
+
+        With `edits`, a list of the arguments of several Text
+        operations on the same file, the file is read once, each edit
+        is applied in turn, and the result written once.
+        """
+        if self.stream and content is None and self.path is not None:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if size:
+                yield from self.edit()
+                return
+
+        exists = False
+        if self.path is not None:
+            try:
+                with open(self.path, 'r') as input_:
+                    self._content = input_.read()
+                    exists = True
+            except FileNotFoundError:
+                pass
+
+        content = self._content if content is None else content
+        if self.edits:
+            for kwargs in self.edits:
+                op = Text(**dict(kwargs, name=self._name))
+                content = yield from op.apply(content)
+            self._rv = content
+        else:
+            self._rv = yield from self.apply(content)
 
         # yield log_message(logging.DEBUG, msg=self._rv, name=self._name)
 
         if self._rv is not None and self.path is not None:
-            with open(self.path, 'w') as output:
-                output.write(self._rv)
-                output.flush()
+            if exists and digest(self._rv) == digest(self._content):
+                yield log_message(
+                    logging.INFO, msg="{} unchanged.".format(self.path),
+                    name=self._name)
+            else:
+                write_atomic(self.path, self._rv)
+                yield log_message(
+                    logging.INFO, msg="{} changed.".format(self.path),
+                    name=self._name)
 
 
 class Command:
@@ -112,70 +271,419 @@ class Command:
     def arguments(**kwargs):
         return {"data": kwargs.get("data", "")}
 
+    @staticmethod
+    def read(stream, level, queue_, limit=65536):
+        """
+        Pass the lines of `stream` to `queue_` as they arrive.
+
+        None marks the end of the stream.
+        """
+        try:
+            for line in iter(lambda: stream.readline(limit), b""):
+                queue_.put((level, line))
+        finally:
+            stream.close()
+            queue_.put(None)
+
     def __init__(
         self, name="yardstick.Command", **kwargs
     ):
         self._name = name
+        self._buffer = 256
         for k, v in kwargs.items():
             setattr(self, k, v)
-        self._args = self.data.strip().split()
 
     def __call__(self, args=None, wd=None, sudo=False, sudoPwd=None):
-        args = self._args if args is None else args
+        """
+        Run the command, and yield its output line by line as it is
+        produced. Standard error is logged at WARNING level.
+
+        No more than a small number of lines are held in memory; a
+        process which writes faster than they can be sent must wait.
+
+        :param args: A command line to run instead of `data`, as
+            a string or a list of words. With `sudo`, the whole line
+            runs in a shell as the superuser.
+        """
+        if args is None:
+            args = self.data.strip()
+        elif not isinstance(args, str):
+            args = " ".join(args)
+        if sudo:
+            args = "sudo -S -p '' sh -c " + shlex.quote(args)
+
+        p = subprocess.Popen(
+            args,
+            cwd=wd, shell=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
         if sudo:
-            p = subprocess.Popen(
-                ["sudo", "-S"] + args,
-                cwd=wd, shell=True,
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL)
             yield log_message(logging.DEBUG, msg=str(p), name=self._name)
-            self._out, self._err = p.communicate(
-                "{}\n".format(sudoPwd).encode("utf-8"))
+            try:
+                p.stdin.write("{}\n".format(sudoPwd).encode("utf-8"))
+            except BrokenPipeError:
+                pass
+        p.stdin.close()
+
+        lines = queue.Queue(maxsize=self._buffer)
+        readers = [
+            threading.Thread(
+                target=self.read, args=(stream, level, lines), daemon=True
+            )
+            for stream, level in (
+                (p.stdout, logging.INFO), (p.stderr, logging.WARNING)
+            )
+        ]
+        for reader in readers:
+            reader.start()
+
+        nDone = 0
+        while nDone < len(readers):
+            item = lines.get()
+            if item is None:
+                nDone += 1
+            else:
+                level, line = item
+                yield log_message(
+                    level,
+                    msg=line.decode("utf-8", errors="replace").rstrip("\n"),
+                    name=self._name
+                )
+
+        self._returncode = p.wait()
+        if self._returncode:
+            yield log_message(
+                logging.WARNING,
+                msg="Exit status {}.".format(self._returncode),
+                name=self._name
+            )
+
+class Inotify:
+    """
+    A minimal binding through `ctypes` to the inotify API of Linux.
+
+    The symbols are looked up in the running process, which has libc
+    loaded already, so that nothing is spawned to search for it.
+
+    Construction raises OSError where the API is not available.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self):
+        error = None
+        for name in (None, "libc.so.6"):
+            try:
+                self._libc = ctypes.CDLL(name, use_errno=True)
+                init = self._libc.inotify_init1
+                break
+            except (AttributeError, OSError) as e:
+                error = e
         else:
-            p = subprocess.Popen(
-                args,
-                cwd=wd, shell=True,
-                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL)
-            self._out, self._err = p.communicate()
-
-        for stream, level in ((p.stdout, logging.INFO), (p.stderr, logging.WARNING)):
+            raise OSError("inotify is not available") from error
+
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path, mask):
+        rv = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), ctypes.c_uint32(mask)
+        )
+        if rv < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        return rv
+
+    def wait(self, timeout):
+        """
+        Block until there are events, or until `timeout` seconds pass.
+
+        :returns: The set of the names of the files in the watched
+            directories which had events. It is empty on a timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        rv = set()
+        while ready:
             try:
-                for text in stream.readlines():
-                    yield log_message(level, msg=text, name=self._name)
-            except (AttributeError, ValueError):
-                continue
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos + 16 <= len(buf):
+                wd, mask, cookie, size = struct.unpack_from("iIII", buf, pos)
+                name = buf[pos + 16:pos + 16 + size].rstrip(b"\0")
+                rv.add(os.fsdecode(name))
+                pos += 16 + size
+        return rv
+
+    def close(self):
+        os.close(self.fd)
+
 
 class Wait(Command):
+    """
+    Pause, or wait for a condition to be met.
+
+    Without `data` or `probe`, a Wait simply sleeps for `interval`.
+
+    With `data`, the command is run repeatedly until a line of its
+    output matches `condition`.
+
+    With `probe`, the condition is tested natively, without a shell:
+
+    * `file:/path` is met when the file exists, and if there is a
+      `condition`, when its content matches it. Where inotify is
+      available the wait ends as soon as the file is written.
+    * `port:host:nnnn` (or `port:nnnn` for localhost) is met when
+      a TCP connection can be made. In a local section, `port:nnnn`
+      is a port of the host being operated.
+    * `process:name` is met when a process of that name is running.
+
+    Successive attempts are spaced by `interval`, multiplied each time
+    by `backoff` up to `ceiling`, and varied at random by the fraction
+    `jitter`. There are no more than `limit` attempts, and none after
+    `deadline` seconds.
+
+    """
+
+    probes = ("file", "port", "process")
 
     @staticmethod
     def arguments(**kwargs):
-        return {
+        rv = {
             "interval": float(kwargs.get("interval", "2.0")),
             "limit": int(kwargs.get("limit", "60")),
             "data": kwargs.get("data", ""),
             "condition": kwargs.get("condition", None),
+            "backoff": float(kwargs.get("backoff", "1.0")),
+            "ceiling": float(kwargs.get("ceiling", "30.0")),
+            "jitter": float(kwargs.get("jitter", "0.0")),
+            "deadline": float(kwargs.get("deadline") or "0") or None,
+            "probe": kwargs.get("probe", None) or None,
         }
+        if rv["probe"] and rv["probe"].split(":")[0] not in Wait.probes:
+            raise ValueError("Unknown probe {}".format(rv["probe"]))
+        if rv["condition"] is not None:
+            compile_pattern(rv["condition"], re.MULTILINE)
+        return rv
 
     def __init__(
         self, name="yardstick.Wait", **kwargs
     ):
+        kwargs = dict(
+            {
+                "backoff": 1.0, "ceiling": 30.0, "jitter": 0.0,
+                "deadline": None, "probe": None
+            },
+            **kwargs
+        )
         super().__init__(name, **kwargs)
 
+    def delays(self):
+        """
+        Generate the pauses to make between attempts.
+
+        """
+        start = time.monotonic()
+        delay = self.interval
+        for n in range(self.limit):
+            rv = min(delay, self.ceiling)
+            rv *= 1 + random.uniform(-self.jitter, self.jitter)
+            if self.deadline:
+                remaining = start + self.deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                rv = min(rv, remaining)
+            yield max(0, rv)
+            delay *= self.backoff
+
+    def check_file(self, path):
+        try:
+            with open(path, 'r') as input_:
+                content = input_.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return False
+
+        return (
+            self.condition is None or
+            compile_pattern(self.condition, re.MULTILINE).search(content)
+            is not None
+        )
+
+    def check_port(self, address):
+        host, _, port = address.rpartition(":")
+        try:
+            with socket.create_connection(
+                (host or "localhost", int(port)), timeout=1
+            ):
+                return True
+        except OSError:
+            return False
+
+    def check_process(self, name):
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                with open(os.path.join("/proc", pid, "comm"), 'r') as comm:
+                    if comm.read().strip() == name:
+                        return True
+                with open(
+                    os.path.join("/proc", pid, "cmdline"), 'rb'
+                ) as cmdline:
+                    argv = cmdline.read().split(b"\0")
+                    if os.path.basename(argv[0]).decode(
+                        "utf-8", errors="replace"
+                    ) == name:
+                        return True
+            except OSError:
+                continue
+        return False
+
+    def poll(self):
+        """
+        Test the probe until it is met, or the attempts run out.
+
+        """
+        kind, _, target = self.probe.partition(":")
+        check = getattr(self, "check_{}".format(kind))
+        watcher = None
+        if kind == "file":
+            try:
+                watcher = Inotify()
+                watcher.watch(
+                    os.path.dirname(os.path.abspath(target)) or "/",
+                    Inotify.IN_CREATE | Inotify.IN_MOVED_TO |
+                    Inotify.IN_CLOSE_WRITE | Inotify.IN_MODIFY |
+                    Inotify.IN_ATTRIB
+                )
+            except OSError:
+                if watcher is not None:
+                    watcher.close()
+                watcher = None
+
+        try:
+            rv = check(target)
+            pauses = self.delays()
+            while not rv:
+                try:
+                    pause = next(pauses)
+                except StopIteration:
+                    break
+                if watcher is not None:
+                    # Events for other files neither end the pause
+                    # nor count as attempts.
+                    end = time.monotonic() + pause
+                    remaining = pause
+                    while remaining > 0 and not rv:
+                        if os.path.basename(target) in watcher.wait(remaining):
+                            rv = check(target)
+                        remaining = end - time.monotonic()
+                else:
+                    time.sleep(pause)
+                rv = rv or check(target)
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+        if rv:
+            yield log_message(
+                logging.INFO, msg="Probe {} met.".format(self.probe),
+                name=self._name)
+        else:
+            yield log_message(
+                logging.WARNING, msg="Probe {} unmet.".format(self.probe),
+                name=self._name)
+
     def __call__(self, args=None, wd=None, sudo=False, sudoPwd=None):
+        if self.probe:
+            yield from self.poll()
+            return
+
         if not self.data or self.condition is None:
             time.sleep(self.interval)
             return
 
-        n = 0
         match = None
-        rObj = re.compile(self.condition, re.MULTILINE)
-        while match is None and n < self.limit:
-            time.sleep(self.interval)
+        rObj = compile_pattern(self.condition, re.MULTILINE)
+        for pause in self.delays():
+            time.sleep(pause)
             for result in super().__call__(args, wd, sudo, sudoPwd):
                 yield result
-                match = rObj.search(result["msg"])
-            n += 1
+                match = match or rObj.search(result[2])
+            if match is not None:
+                break
+
+def digest(text):
+    """
+    Return a hash of some text.
+
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, text, keep=False):
+    """
+    Replace the file at `path` with `text`.
+
+    The text goes first to a temporary file in the same directory, which
+    is then renamed over the original. Symbolic links are followed, and
+    the mode and ownership of an existing file are kept. A new file
+    gets the mode the umask allows, which is applied when the temporary
+    file is created rather than read from the process.
+
+    :param text: A string, or else a sequence of bytes objects
+        which is written one item at a time.
+    :param keep: If True, an existing file with the same content is
+        left as it is.
+    :returns: True if the file was replaced.
+    """
+    path = os.path.realpath(path)
+    while True:
+        tmp = os.path.join(
+            os.path.dirname(path),
+            ".yardstick-{:016x}".format(random.getrandbits(64))
+        )
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            break
+        except FileExistsError:
+            continue
+
+    try:
+        with os.fdopen(fd, 'w' if isinstance(text, str) else 'wb') as output:
+            if isinstance(text, (str, bytes)):
+                output.write(text)
+            else:
+                output.writelines(text)
+            output.flush()
+            os.fsync(output.fileno())
+
+        if keep and os.path.isfile(path) and filecmp.cmp(
+            tmp, path, shallow=False
+        ):
+            os.remove(tmp)
+            return False
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            pass
+        else:
+            os.chmod(tmp, stat.S_IMODE(st.st_mode))
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except (AttributeError, PermissionError):
+                pass
+
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return True
+
 
 def config_parser():
     rv = configparser.ConfigParser(
@@ -193,26 +701,434 @@ def config_settings(ini):
     return ini.defaults()
 
 
+def compile_plan(ini):
+    """
+    Resolve the sections of a configuration into a plan of operations.
+
+    Interpolation is done and the parameters of each operation are
+    converted to their types here, once, on the controller. The plan
+    is made only of builtin types, so that it can be sent to the
+    target as it is. A section which cannot be resolved carries the
+    reason as its `error`.
+
+    :returns: A dictionary of the `settings`, and a list of `sections`.
+        Each section has its `name`, `items`, `type`, `sudo`,
+        `action`, `group`, `after`, `files` and `arguments`.
+    """
+    ops = {i.__name__: i for i in (Command, Text, Wait)}
+    rv = {"settings": dict(config_settings(ini)), "sections": []}
+    for name in ini.sections():
+        entry = {"name": name, "items": {}, "error": None}
+        try:
+            items = dict(ini[name].items())
+            typ = items.get("type")
+            Op = ops.get(typ)
+            entry.update({
+                "items": items,
+                "type": typ,
+                "sudo": ini.getboolean(name, "sudo", fallback=False),
+                "action": items.get("action") or "remote",
+                "group": items.get("group") or "",
+                "after": [
+                    i for i in re.split(r"[,\s]+", items.get("after") or "")
+                    if i
+                ],
+                "files": section_files(items),
+                "arguments": Op.arguments(**items) if Op else None,
+            })
+        except Exception as e:
+            entry["error"] = str(getattr(e, "args", e) or e)
+        rv["sections"].append(entry)
+    return rv
+
+
+def coalesce_plan(plan):
+    """
+    Merge consecutive Text sections which edit the same file.
+
+    Sections are merged when they share a `path`, `sudo` and `action`,
+    are in no `group`, are not edited in `stream` mode, and are not
+    named by another section's `after`. The merged section keeps the
+    originals in order under `edits`, and its operation reads and
+    writes the file just once.
+
+    :returns: A new plan.
+    """
+    named = {i for entry in plan["sections"] for i in entry.get("after") or []}
+
+    def key(entry):
+        args = entry.get("arguments") or {}
+        if (
+            entry.get("type") != "Text" or entry["error"] or not args
+            or not args.get("path") or args.get("stream")
+            or entry.get("group") or entry["name"] in named
+        ):
+            return None
+        return (args["path"], entry["sudo"], entry["action"])
+
+    runs = []
+    for entry in plan["sections"]:
+        if runs and key(entry) is not None and key(entry) == key(runs[-1][0]):
+            runs[-1].append(entry)
+        else:
+            runs.append([entry])
+
+    rv = {"settings": plan["settings"], "sections": []}
+    for run in runs:
+        if len(run) == 1:
+            rv["sections"].extend(run)
+            continue
+
+        head = run[0]
+        path = head["arguments"]["path"]
+        rv["sections"].append(dict(
+            head,
+            name=" + ".join(i["name"] for i in run),
+            items={
+                "type": "Text", "path": path,
+                "edits": json.dumps(
+                    [sorted(i["items"].items()) for i in run]
+                ),
+            },
+            after=[],
+            files=sorted({j for i in run for j in i["files"]}),
+            arguments={
+                "path": path,
+                "edits": [
+                    dict(i["arguments"], path=None) for i in run
+                ],
+            },
+            edits=run,
+        ))
+    return rv
+
+
+def plan_parser(plan):
+    """
+    Make a parser which holds the resolved sections of a plan.
+
+    Its values are already interpolated, so it does no interpolation
+    of its own. Sections merged by :py:func:`coalesce_plan` appear
+    as they were.
+
+    """
+    rv = configparser.ConfigParser(
+        allow_no_value=True, interpolation=None
+    )
+    rv.read_dict(collections.OrderedDict(
+        [("DEFAULT", plan["settings"])] +
+        [
+            (j["name"], j["items"]) for i in plan["sections"]
+            for j in i.get("edits") or [i]
+        ]
+    ))
+    return rv
+
+
 def log_message(lvl, msg, *args, **kwargs):
-    msg = logging.LogRecord(
-        name=kwargs.get("name", "unknown"),
-        level=lvl,
-        pathname="",
-        lineno="",
-        msg=msg,
-        args=args,
-        exc_info=None,
+    """
+    Make a compact log record to send over a channel.
+
+    Only the fields the controller needs travel on the wire. It expands
+    them into a full `logging.LogRecord`.
+
+    :returns: A tuple of (name, levelno, msg, created).
+    """
+    return (
+        kwargs.get("name", "unknown"),
+        lvl,
+        str(msg) % args if args else str(msg),
+        time.time()
     )
-    return vars(msg)
+
+
+class Batch:
+    """
+    Buffers log records on the target and sends them as lists.
+
+    A batch goes when it holds `size` records, or when its oldest
+    record is `interval` seconds old, whichever comes first.
+
+    """
+
+    def __init__(self, channel, size=200, interval=0.25):
+        self.channel = channel
+        self.size = size
+        self.interval = interval
+        self.records = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def send(self, record):
+        with self.lock:
+            self.records.append(record)
+            if len(self.records) >= self.size:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.records:
+            self.channel.send(self.records)
+            self.records = []
+
+
+def file_signature(path, prior=None):
+    """
+    Return the size, modification time and content hash of a file.
+
+    The file is hashed only if its size or modification time differ
+    from those of `prior`. The content of a directory is the sorted
+    list of its entries.
+
+    :returns: A list of [size, mtime_ns, digest], or None if there is
+        no file at `path`.
+    """
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    if prior and prior[:2] == [st.st_size, st.st_mtime_ns]:
+        return prior
+
+    hash_ = hashlib.sha256()
+    if stat.S_ISDIR(st.st_mode):
+        for name in sorted(os.listdir(path)):
+            hash_.update(os.fsencode(name) + b"\0")
+    else:
+        with open(path, 'rb') as input_:
+            for chunk in iter(lambda: input_.read(65536), b""):
+                hash_.update(chunk)
+    return [st.st_size, st.st_mtime_ns, hash_.hexdigest()]
+
+
+def section_fingerprint(items):
+    """
+    Return a hash of the resolved content of a section.
+
+    """
+    return digest(json.dumps(sorted(items.items())))
+
+
+def section_files(items):
+    """
+    Return the paths of the target files a section writes.
+
+    These are the `path` of a Text operation, and any paths declared
+    by a `files` key.
+    """
+    rv = re.split(r"[,\s]+", (items.get("files") or "").strip())
+    if items.get("type") == "Text":
+        rv.append(items.get("path") or "")
+    return sorted(os.path.expanduser(i) for i in set(rv) if i)
+
+
+def state_load(path=STATE_PATH):
+    """
+    Read the record of sections run before on this target.
+
+    """
+    try:
+        with open(os.path.expanduser(path), 'r') as input_:
+            return json.load(input_)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def state_save(state, path=STATE_PATH):
+    """
+    Store the record of sections run on this target.
+
+    """
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, json.dumps(state, indent=0, sort_keys=True))
+
+
+def state_sign(state):
+    """
+    Take the signatures of the files of the sections which completed
+    in this run.
+
+    Those sections are recorded with a list of their files. They are
+    signed only once every section is done, so that a file written by
+    several sections has the signature of its final content.
+
+    :returns: The state, modified in place.
+    """
+    for entry in state.values():
+        if entry and isinstance(entry.get("files"), list):
+            entry["files"] = {p: file_signature(p) for p in entry["files"]}
+    return state
+
+
+def run_section(
+    section, sudoPwd, send, name="yardstick.lockstep", state=None
+):
+    """
+    Execute the operation described by one section.
+
+    :param section: One of the sections of a plan, as made by
+        :py:func:`compile_plan`.
+    :param send: A function which sends each log record.
+    :param state: An optional dictionary of the sections run before.
+        A section whose content and target files are just as they were
+        when it last succeeded is not run again. Only sections which
+        write files can be skipped in this way. The files of a section
+        which completes are signed later, by :py:func:`state_sign`.
+    :returns: True if the operation logged no errors.
+    """
+    files = (section.get("files") or []) if state is not None else []
+    if files:
+        fingerprint = section_fingerprint(section["items"])
+        prior = state.get(section["name"], {})
+        sigs = prior.get("files", {})
+        if prior.get("body") == fingerprint and isinstance(sigs, dict) and all(
+            p in sigs and file_signature(p, sigs[p]) == sigs[p]
+            for p in files
+        ):
+            state[section["name"]] = {"body": fingerprint, "files": files}
+            send(log_message(
+                logging.INFO,
+                msg="Task '{}' cached.".format(section["name"]), name=name
+            ))
+            return True
+
+    send(log_message(
+        logging.INFO, msg="Task '{}'".format(section["name"]), name=name
+    ))
+
+    Op = {i.__name__: i for i in (Command, Text, Wait)}.get(
+        section.get("type"), None
+    )
+    if section["error"] or Op is None or section.get("arguments") is None:
+        send(log_message(
+            logging.ERROR,
+            msg="Bad parameters{}".format(
+                ": {}".format(section["error"]) if section["error"] else "."
+            ),
+            name=name
+        ))
+        return False
+
+    rv = True
+    op = Op(**section["arguments"])
+    for msg in op(sudo=section["sudo"], sudoPwd=sudoPwd):
+        send(msg)
+        rv = rv and msg[1] < logging.ERROR
+
+    if files and rv:
+        state[section["name"]] = {"body": fingerprint, "files": files}
+    elif files:
+        state.pop(section["name"], None)
+    return rv
+
+
+def run_graph(
+    plan, taskNrs, sudoPwd, send, workers=4, name="yardstick.lockstep",
+    state=None
+):
+    """
+    Execute a stage of sections concurrently, in the order they declare.
+
+    A section which names others in its `after` key starts only when
+    those are complete. Others may run at once, up to `workers`
+    at a time.
+
+    A section may follow one which precedes the stage; that is already
+    complete. Any other reference is an error.
+
+    :returns: True if every section completed without error.
+    """
+    sections = plan["sections"]
+    names = [i["name"] for i in sections]
+    deps = {n: set() for n in taskNrs}
+    rv = True
+    for n in taskNrs:
+        for dep in sections[n].get("after") or []:
+            if dep in names and names.index(dep) in deps:
+                deps[n].add(names.index(dep))
+            elif dep not in names or names.index(dep) > min(taskNrs):
+                send(log_message(
+                    logging.ERROR,
+                    msg="Section '{}' cannot follow '{}'.".format(
+                        names[n], dep),
+                    name=name
+                ))
+                rv = False
+
+    if not rv:
+        return rv
+
+    done = set()
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if rv:
+                for n in taskNrs:
+                    if (
+                        n not in done and n not in running.values()
+                        and deps[n] <= done
+                    ):
+                        job = pool.submit(
+                            run_section, sections[n], sudoPwd, send, name,
+                            state
+                        )
+                        running[job] = n
+
+            if not running:
+                break
+
+            finished, pending = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for job in finished:
+                done.add(running.pop(job))
+                try:
+                    rv = job.result() and rv
+                except Exception as e:
+                    send(log_message(
+                        logging.ERROR,
+                        msg=str(getattr(e, "args", e) or e),
+                        name=name
+                    ))
+                    rv = False
+
+    for n in taskNrs:
+        if n not in done:
+            send(log_message(
+                logging.ERROR if rv else logging.WARNING,
+                msg="Task '{}' {}.".format(
+                    names[n], "is blocked by a cycle" if rv else "skipped"),
+                name=name
+            ))
+    return rv and len(done) == len(taskNrs)
 
 
 def lockstep():
     """
     Executed on the target by the `auto` command.
 
+    Receives a plan of sections as made by :py:func:`compile_plan`,
+    then section numbers, and executes each in turn, echoing the
+    number back on completion. Several numbers may be queued in the
+    channel when the controller is pipelining. A list of numbers is a
+    stage whose sections may run concurrently. Once a task has logged
+    an error, subsequent tasks are skipped.
 
     """
     logName = "yardstick.lockstep"
+    batch = Batch(channel)
     try:
         msg = log_message(
             logging.INFO,
@@ -220,63 +1136,56 @@ def lockstep():
             name=logName)
         channel.send(msg)
 
-        config = channel.receive()
-        try:
-            ini = config_parser()
-            ini.read_string(config)
-            settings = config_settings(ini)
-        except Exception as e:
-            ini = None
-            settings = {}
-            channel.send(config)
-            channel.send(str(getattr(e, "args", e) or e))
-
+        plan = channel.receive()
+        sections = plan["sections"]
         args = channel.receive()
         sudoPwd = channel.receive()
         ts = channel.receive()
 
+        state = state_load() if args.get("idempotent") else None
+        halted = False
         taskNr = channel.receive()
         while taskNr is not None:
-            secName = ini.sections()[taskNr]
-            msg = log_message(
-                logging.INFO, msg="Task '{}'".format(secName),
-                name=logName
-            )
-            channel.send(msg)
-
-            section = ini[secName]
-            sudo = section.getboolean("sudo", fallback=False)
-            typ = section.get("type", fallback=None)
-            Op = {i.__name__: i for i in (Command, Text, Wait)}.get(typ, None)
-            if any(i is None for i in (sudo, typ, Op)):
-                msg = log_message(
-                    logging.ERROR, msg="Bad parameters.",
-                    name=logName
+            if halted:
+                for n in (taskNr if isinstance(taskNr, list) else [taskNr]):
+                    batch.send(log_message(
+                        logging.WARNING,
+                        msg="Task '{}' skipped.".format(sections[n]["name"]),
+                        name=logName
+                    ))
+            elif isinstance(taskNr, list):
+                halted = not run_graph(
+                    plan, taskNr, sudoPwd, batch.send,
+                    args.get("workers", 4), logName, state
                 )
-                channel.send(msg)
             else:
-                op = Op(**Op.arguments(**section))
-                for msg in op(sudo=sudo, sudoPwd=sudoPwd):
-                    channel.send(msg)
+                halted = not run_section(
+                    sections[taskNr], sudoPwd, batch.send, logName, state
+                )
 
+            batch.flush()
             channel.send(taskNr)
             taskNr = channel.receive()
 
+        if state is not None:
+            state_save(state_sign(state))
+
     except (EOFError, OSError) as e:
-        channel.send(
+        batch.send(
             log_message(
                 logging.ERROR,
                 msg=str(getattr(e, "args", e) or e),
                 name=logName)
         )
     except Exception as e:
-        channel.send(
+        batch.send(
             log_message(
                 logging.ERROR,
                 msg=str(getattr(e, "args", e) or e),
                 name=logName)
         )
     finally:
+        batch.flush()
         channel.send(None)
 
 
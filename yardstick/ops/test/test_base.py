@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import os.path
+import subprocess
+import tempfile
+import textwrap
+import time
+import unittest
+from unittest import mock
+
+import yardstick.ops.base
+import yardstick.ops.modder
+
+
+class LockstepTester(unittest.TestCase):
+
+    defaults = textwrap.dedent("""
+        [DEFAULT]
+        admin.net = 127.0.0.1/8
+        admin.port =
+        admin.user =
+        admin.python =
+    """)
+
+    @staticmethod
+    def args(**kwargs):
+        rv = argparse.Namespace(
+            host="localhost", port=None, user=None, python=None,
+            identity="", forget=False, debug=False,
+            hosts=[], width=1, window=1, modules=[], paths=[]
+        )
+        for k, v in kwargs.items():
+            setattr(rv, k, v)
+        return rv
+
+    def operate(self, config, **kwargs):
+        return yardstick.ops.base.operate(
+            yardstick.ops.modder, config, self.args(**kwargs), None,
+            name="yardstick.test"
+        )
+
+    def test_window_completes_all_sections(self):
+        config = LockstepTester.defaults + textwrap.dedent("""
+            [one]
+            type = Command
+            data = echo one
+
+            [two]
+            type = Wait
+            interval = 0
+
+            [here]
+            action = local
+            type = Command
+            data = true
+
+            [three]
+            type = Command
+            data = echo three
+        """)
+        for window in (1, 2, 8):
+            with self.subTest(window=window):
+                self.assertEqual(4, self.operate(config, window=window))
+
+    def test_window_halts_on_error(self):
+        config = LockstepTester.defaults + textwrap.dedent("""
+            [one]
+            type = Command
+            data = echo one
+
+            [bad]
+            type = Nonesuch
+
+            [three]
+            type = Command
+            data = echo three
+
+            [four]
+            type = Command
+            data = echo four
+        """)
+        for window in (1, 3):
+            with self.subTest(window=window):
+                with self.assertLogs("yardstick.test") as logs:
+                    self.assertEqual(1, self.operate(config, window=window))
+                self.assertNotIn(
+                    "INFO:yardstick.lockstep:Task 'four'", logs.output
+                )
+
+
+class StepTester(unittest.TestCase):
+
+    def test_steps(self):
+        ini = yardstick.ops.modder.config_parser()
+        ini.read_string(textwrap.dedent("""
+            [a]
+            [b]
+            group = one
+            [c]
+            group = one
+            [d]
+            group = two
+            [e]
+            action = local
+            group = two
+            [f]
+        """))
+        self.assertEqual(
+            [0, [1, 2], [3], 4, 5],
+            list(yardstick.ops.base.gen_steps(
+                yardstick.ops.modder.compile_plan(ini)
+            ))
+        )
+
+    def test_stage_over_lockstep(self):
+        config = LockstepTester.defaults + textwrap.dedent("""
+            [one]
+            type = Command
+            data = echo one
+
+            [clean-a]
+            group = clean
+            type = Command
+            data = echo a
+
+            [clean-b]
+            group = clean
+            after = clean-a
+            type = Command
+            data = echo b
+
+            [two]
+            type = Command
+            data = echo two
+        """)
+        rv = yardstick.ops.base.operate(
+            yardstick.ops.modder, config, LockstepTester.args(window=2),
+            None, name="yardstick.test"
+        )
+        self.assertEqual(4, rv)
+
+
+class RecordTester(unittest.TestCase):
+
+    def test_expand_batch(self):
+        batch = [
+            yardstick.ops.modder.log_message(logging.INFO, "one", name="a"),
+            yardstick.ops.modder.log_message(logging.ERROR, "two", name="b"),
+        ]
+        rv = list(yardstick.ops.base.gen_records(batch))
+        self.assertEqual(2, len(rv))
+        self.assertEqual("a", rv[0].name)
+        self.assertEqual("one", rv[0].getMessage())
+        self.assertEqual("ERROR", rv[1].levelname)
+        self.assertEqual(batch[1][3], rv[1].created)
+
+    def test_expand_record_dict(self):
+        msg = vars(logging.makeLogRecord({"msg": "old", "levelno": 20}))
+        rv = list(yardstick.ops.base.gen_records(msg))
+        self.assertEqual("old", rv[0].msg)
+
+    def test_reject_results(self):
+        msg = {"errors": [], "failures": [], "skipped": [], "total": 0}
+        with self.assertRaises(ValueError):
+            list(yardstick.ops.base.gen_records(msg))
+
+
+class ExecnetStringTester(unittest.TestCase):
+
+    def test_local_host(self):
+        ini = yardstick.ops.modder.config_parser()
+        ini.read_string(LockstepTester.defaults)
+        args = LockstepTester.args(persist=600)
+        rv = yardstick.ops.base.execnet_string(
+            yardstick.ops.modder.compile_plan(ini), args
+        )
+        self.assertTrue(rv.startswith("popen"))
+
+    def test_remote_host(self):
+        ini = yardstick.ops.modder.config_parser()
+        ini.read_string(LockstepTester.defaults)
+        args = LockstepTester.args(host="192.168.56.10", port=2222)
+        rv = yardstick.ops.base.execnet_string(
+            yardstick.ops.modder.compile_plan(ini), args
+        )
+        self.assertTrue(rv.startswith("ssh=-i "))
+        self.assertIn("-p 2222 root@192.168.56.10//python=", rv)
+        self.assertNotIn("Control", rv)
+
+    def test_target_probe(self):
+        self.assertEqual(
+            "port:10.0.0.1:22",
+            yardstick.ops.base.target_probe("port:22", "10.0.0.1")
+        )
+        self.assertEqual(
+            "port:localhost:22",
+            yardstick.ops.base.target_probe("port:localhost:22", "10.0.0.1")
+        )
+        self.assertEqual(
+            "file:/etc/hosts",
+            yardstick.ops.base.target_probe("file:/etc/hosts", "10.0.0.1")
+        )
+        self.assertIsNone(yardstick.ops.base.target_probe(None, "10.0.0.1"))
+
+    def test_control_options(self):
+        with tempfile.TemporaryDirectory() as parent:
+            path = os.path.join(parent, "control")
+            rv = yardstick.ops.base.control_options(60, path=path)
+            self.assertTrue(os.path.isdir(path))
+
+        opts = rv.split()
+        self.assertEqual(6, len(opts))
+        self.assertIn("ControlMaster=auto", opts)
+        self.assertIn("ControlPersist=60", opts)
+        self.assertIn("ControlPath={}".format(os.path.join(path, "%C")), opts)
+
+
+class SessionTester(unittest.TestCase):
+
+    program = textwrap.dedent("""
+        import os
+        config, args, sudoPwd, ts = [channel.receive() for i in range(4)]
+        channel.send(os.getpid())
+        channel.send(None)
+    """)
+
+    def test_one_gateway_for_many_programs(self):
+        args = LockstepTester.args()
+        with yardstick.ops.base.Session(
+            LockstepTester.defaults, args, None, name="yardstick.test"
+        ) as session:
+            first = session.run(SessionTester.program)
+            rest = session.run_many([SessionTester.program] * 3)
+        self.assertIsInstance(first, int)
+        self.assertEqual([first] * 3, rest)
+        self.assertIsNone(session.gateway)
+
+
+class ProgramCacheTester(unittest.TestCase):
+
+    def test_program_is_cached(self):
+        with tempfile.TemporaryDirectory() as path:
+            rv = yardstick.ops.base.cached_program(
+                [ProgramCacheTester], path=path
+            )
+            self.assertEqual(
+                yardstick.ops.base.check_program(ProgramCacheTester), rv
+            )
+            entries = os.listdir(os.path.join(path, "programs"))
+            self.assertEqual(1, len(entries))
+
+            fP = os.path.join(path, "programs", entries[0])
+            with open(fP, 'w') as cached:
+                cached.write("# cached")
+
+            rv = yardstick.ops.base.cached_program(
+                [ProgramCacheTester], path=path
+            )
+            self.assertEqual("# cached", rv)
+
+    def test_classes_have_their_own_entries(self):
+        with tempfile.TemporaryDirectory() as path:
+            for class_ in (ProgramCacheTester, SessionTester):
+                yardstick.ops.base.cached_program([class_], path=path)
+            entries = os.listdir(os.path.join(path, "programs"))
+            self.assertEqual(2, len(entries))
+
+
+class ImportTester(unittest.TestCase):
+
+    class Checks(unittest.TestCase):
+
+        def test_something(self):
+            self.assertTrue(os.path.isdir("/"))
+
+    def test_imports_named_modules(self):
+        rv = list(yardstick.ops.base.gen_imports(
+            "os.path.isdir(x)\nlogging.info(y)",
+            ["collections", "collections.abc", "logging", "os", "tarfile"]
+        ))
+        self.assertEqual([
+            "import logging", "import os",
+            'collections = lazy_import("collections")',
+            'tarfile = lazy_import("tarfile")',
+        ], rv)
+
+    def test_program_imports_only_what_it_names(self):
+        rv = yardstick.ops.base.check_program(ImportTester.Checks)
+        lines = rv.splitlines()
+        self.assertIn("import os", lines)
+        self.assertIn("import unittest", lines)
+        self.assertNotIn("import tarfile", lines)
+        self.assertIn('tarfile = lazy_import("tarfile")', lines)
+
+    def test_lazy_modules_import_on_use(self):
+        rv = yardstick.ops.base.check_program(ImportTester.Checks)
+        namespace = {"__name__": "test"}
+        exec(rv, namespace)
+        self.assertIn("Checks", namespace)
+        self.assertTrue(callable(namespace["tarfile"].open))
+        self.assertTrue(namespace["xml"].etree)
+
+
+class BundleTester(unittest.TestCase):
+
+    class Passes(unittest.TestCase):
+
+        def test_pass(self):
+            self.assertTrue(self.settings)
+
+    class Fails(unittest.TestCase):
+
+        def test_fail(self):
+            self.fail("Deliberate")
+
+        def test_pass(self):
+            self.assertTrue(self.args)
+
+    def test_bundle_runs_all_classes(self):
+        program = yardstick.ops.base.bundle_program(
+            [BundleTester.Passes, BundleTester.Fails]
+        )
+        with self.assertLogs("yardstick.test") as logs:
+            rv = yardstick.ops.base.operate(
+                program, LockstepTester.defaults, LockstepTester.args(),
+                None, name="yardstick.test"
+            )
+        self.assertEqual(3, rv["total"])
+        self.assertEqual(1, len(rv["failures"]))
+        self.assertEqual(["Passes", "Fails"], rv["classes"])
+        self.assertEqual(
+            2, len([i for i in logs.output if "Check of" in i])
+        )
+
+
+class WorkersTester(unittest.TestCase):
+
+    class Slow(unittest.TestCase):
+
+        calls = 0
+
+        @classmethod
+        def setUpClass(class_):
+            class_.calls += 1
+
+        def test_one(self):
+            time.sleep(0.4)
+            self.assertEqual(1, self.calls)
+
+        def test_fail(self):
+            self.fail("Deliberate")
+
+        def test_two(self):
+            time.sleep(0.4)
+
+    def run_check(self, **kwargs):
+        program = yardstick.ops.base.check_program(WorkersTester.Slow)
+        return yardstick.ops.base.operate(
+            program, LockstepTester.defaults,
+            LockstepTester.args(**kwargs), None, name="yardstick.test"
+        )
+
+    def test_tests_share_workers(self):
+        then = time.monotonic()
+        rv = self.run_check(workers=3)
+        self.assertLess(time.monotonic() - then, 1.2)
+        self.assertEqual(3, rv["total"])
+        self.assertEqual(1, len(rv["failures"]))
+        self.assertFalse(rv["errors"])
+
+    def test_failfast_stops_new_tests(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                rv = self.run_check(workers=workers, failfast=True)
+                self.assertLess(rv["total"], 3)
+                self.assertEqual(1, len(rv["failures"]))
+
+
+class IncrementalTester(unittest.TestCase):
+
+    class Reads(unittest.TestCase):
+
+        def test_probe(self):
+            text = self.snapshot.text(os.path.expanduser("~/probe.txt"))
+            self.assertIn("probe", text)
+
+    class Runs(unittest.TestCase):
+
+        def test_command(self):
+            subprocess.check_call(["true"])
+
+    class Looks(unittest.TestCase):
+
+        def test_exists(self):
+            self.assertTrue(
+                os.path.isfile(os.path.expanduser("~/probe.txt"))
+            )
+
+    class Cached(unittest.TestCase):
+
+        def test_probe_already_read(self):
+            self.assertIn(
+                os.path.expanduser("~/probe.txt"), self.snapshot._cache
+            )
+
+    class Idle(unittest.TestCase):
+
+        def test_nothing(self):
+            self.assertTrue(True)
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.probe = os.path.join(self.home.name, "probe.txt")
+        with open(self.probe, 'w') as file_:
+            file_.write("probe\n")
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def run_check(self, program):
+        with mock.patch.dict(os.environ, {"HOME": self.home.name}):
+            return yardstick.ops.base.operate(
+                program, LockstepTester.defaults,
+                LockstepTester.args(incremental=True), None,
+                name="yardstick.test"
+            )
+
+    def test_unchanged_class_is_cached(self):
+        program = yardstick.ops.base.check_program(IncrementalTester.Reads)
+        rv = self.run_check(program)
+        self.assertEqual((1, 0), (rv["total"], rv["cached"]))
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.home.name, ".yardstick", "checks.json")
+        ))
+
+        rv = self.run_check(program)
+        self.assertEqual((1, 1), (rv["total"], rv["cached"]))
+
+        st = os.stat(self.probe)
+        with open(self.probe, 'w') as file_:
+            file_.write("changed\n")
+        os.utime(self.probe, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        rv = self.run_check(program)
+        self.assertEqual(0, rv["cached"])
+        self.assertEqual(1, len(rv["failures"]))
+
+        rv = self.run_check(program)
+        self.assertEqual(0, rv["cached"])
+
+    def test_class_which_looks_up_files_is_checked_again(self):
+        program = yardstick.ops.base.check_program(IncrementalTester.Looks)
+        self.run_check(program)
+        rv = self.run_check(program)
+        self.assertEqual((1, 1), (rv["total"], rv["cached"]))
+
+        os.remove(self.probe)
+        rv = self.run_check(program)
+        self.assertEqual(0, rv["cached"])
+        self.assertEqual(1, len(rv["failures"]))
+
+    def test_class_which_reads_nothing_is_not_cached(self):
+        program = yardstick.ops.base.check_program(IncrementalTester.Idle)
+        self.run_check(program)
+        rv = self.run_check(program)
+        self.assertEqual((1, 0), (rv["total"], rv["cached"]))
+
+    def test_programs_of_a_session_share_a_snapshot(self):
+        programs = [
+            yardstick.ops.base.check_program(IncrementalTester.Reads),
+            yardstick.ops.base.check_program(IncrementalTester.Cached),
+        ]
+        args = LockstepTester.args(incremental=False)
+        with mock.patch.dict(os.environ, {"HOME": self.home.name}):
+            with yardstick.ops.base.Session(
+                LockstepTester.defaults, args, None, "yardstick.test"
+            ) as session:
+                reads, cached = [session.run(i) for i in programs]
+
+        self.assertFalse(reads["failures"] or reads["errors"])
+        self.assertFalse(cached["failures"] or cached["errors"])
+
+    def test_programs_at_once_keep_their_own_records(self):
+        programs = [
+            yardstick.ops.base.check_program(IncrementalTester.Idle),
+            yardstick.ops.base.check_program(IncrementalTester.Reads),
+        ]
+        args = LockstepTester.args(incremental=True, workers=3)
+        for n in range(2):
+            with mock.patch.dict(os.environ, {"HOME": self.home.name}):
+                with yardstick.ops.base.Session(
+                    LockstepTester.defaults, args, None, "yardstick.test"
+                ) as session:
+                    idle, reads = session.run_many(programs)
+
+        self.assertEqual((1, 0), (idle["total"], idle["cached"]))
+        self.assertEqual((1, 1), (reads["total"], reads["cached"]))
+
+    def test_class_which_runs_commands_is_not_cached(self):
+        program = yardstick.ops.base.bundle_program(
+            [IncrementalTester.Reads, IncrementalTester.Runs]
+        )
+        self.run_check(program)
+        rv = self.run_check(program)
+        self.assertEqual((2, 1), (rv["total"], rv["cached"]))
+        self.assertFalse(rv["errors"])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import builtins
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import yardstick.ops.checker
+
+
+class SnapshotTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "sshd_config")
+        with open(self.path, 'w') as file_:
+            file_.write("Port 22\nLogLevel VERBOSE\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_file_read_once(self):
+        snapshot = yardstick.ops.checker.Snapshot()
+        with mock.patch.object(builtins, "open", wraps=open) as opener:
+            for i in range(5):
+                self.assertIn("Port 22", snapshot.text(self.path))
+            self.assertEqual(2, len(snapshot.lines(self.path)))
+        self.assertEqual(1, opener.call_count)
+
+    def test_changed_file_read_again(self):
+        snapshot = yardstick.ops.checker.Snapshot()
+        self.assertIn("Port 22", snapshot.text(self.path))
+        st = snapshot.stat(self.path)
+        with open(self.path, 'w') as file_:
+            file_.write("Port 2222\n")
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(("Port 2222\n",), snapshot.lines(self.path))
+
+    def test_missing_file_raises(self):
+        snapshot = yardstick.ops.checker.Snapshot()
+        with self.assertRaises(FileNotFoundError):
+            snapshot.text(os.path.join(self.dir.name, "nonesuch"))
+
+
+class SessionSnapshotTester(unittest.TestCase):
+
+    def tearDown(self):
+        sys.modules.pop("yardstick_session", None)
+
+    def test_programs_of_a_session_share_a_snapshot(self):
+        one = yardstick.ops.checker.session_snapshot(1.0)
+        self.assertIsInstance(one, yardstick.ops.checker.Snapshot)
+        self.assertIs(one, yardstick.ops.checker.session_snapshot(1.0))
+
+    def test_new_session_has_a_new_snapshot(self):
+        one = yardstick.ops.checker.session_snapshot(1.0)
+        two = yardstick.ops.checker.session_snapshot(2.0)
+        self.assertIsNot(one, two)
+        self.assertEqual(
+            [2.0], list(sys.modules["yardstick_session"].snapshots)
+        )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+import yardstick.ops.discovery
+
+
+class EntryPointTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.dir.name, "entry_points.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_scan_only_when_path_changes(self):
+        eps = [["skel", "yardstick.openrc.test_skel:SkelTests"]]
+        with mock.patch.object(
+            yardstick.ops.discovery, "scan", return_value=eps
+        ) as scan:
+            for i in range(3):
+                rv = list(yardstick.ops.discovery.entry_points(
+                    "yardstick.plugin.testcase", path=self.cache
+                ))
+            self.assertEqual(1, scan.call_count)
+            self.assertEqual([tuple(eps[0])], rv)
+
+            with mock.patch.object(
+                yardstick.ops.discovery, "path_key",
+                return_value=[["/nonesuch", 0]]
+            ):
+                list(yardstick.ops.discovery.entry_points(
+                    "yardstick.plugin.testcase", path=self.cache
+                ))
+            self.assertEqual(2, scan.call_count)
+
+    def test_plugins_load_on_demand(self):
+        plugins = yardstick.ops.discovery.Plugins("yardstick.test")
+        eps = [("join", "os.path:join"), ("broken", "nonesuch.module:Foo")]
+        with mock.patch.object(
+            yardstick.ops.discovery, "entry_points", return_value=eps
+        ) as entry_points:
+            self.assertEqual(0, entry_points.call_count)
+            self.assertEqual(["join", "broken"], list(plugins))
+            self.assertIs(os.path.join, plugins["join"])
+            with self.assertRaises(KeyError):
+                plugins["broken"]
+            self.assertEqual(1, entry_points.call_count)
+
+    def test_import_loads_nothing(self):
+        code = textwrap.dedent("""
+            import sys
+            import yardstick.ops.discovery
+            print(any(
+                i in sys.modules for i in (
+                    "pkg_resources", "importlib.metadata",
+                    "yardstick.ops.modder"
+                )
+            ))
+        """)
+        rv = subprocess.check_output(
+            [sys.executable, "-c", code], universal_newlines=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__))
+            )))
+        )
+        self.assertEqual("False", rv.strip())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+import socket
+import textwrap
+import time
+import unittest
+
+import yardstick.ops.base
+import yardstick.ops.fleet
+import yardstick.ops.modder
+
+
+class FleetTester(unittest.TestCase):
+
+    config = textwrap.dedent("""
+        [DEFAULT]
+        admin.net = 127.0.0.1/8
+        admin.port =
+        admin.user =
+        admin.python =
+
+        [hello]
+        type = Command
+        data = echo hello
+
+        [pause]
+        type = Wait
+        interval = 0
+    """)
+
+    def args(self, **kwargs):
+        rv = argparse.Namespace(
+            host=None, port=None, user=None, python=None,
+            identity="", forget=False, debug=False,
+            hosts=[], width=2, modules=[], paths=[]
+        )
+        for k, v in kwargs.items():
+            setattr(rv, k, v)
+        return rv
+
+    def test_host_args_copies(self):
+        args = self.args(hosts=["a", "b"])
+        rv = yardstick.ops.fleet.host_args(args, "a")
+        self.assertEqual("a", rv.host)
+        self.assertIsNone(args.host)
+        self.assertEqual(args.hosts, rv.hosts)
+
+    def test_host_filter_tags_remote_records(self):
+        filter_ = yardstick.ops.fleet.host_filter("yardstick.auto.a", "a")
+        remote = logging.makeLogRecord({"name": "yardstick.lockstep"})
+        local = logging.makeLogRecord({"name": "yardstick.auto.a"})
+        self.assertTrue(filter_(remote))
+        self.assertTrue(filter_(local))
+        self.assertEqual("yardstick.lockstep@a", remote.name)
+        self.assertEqual("yardstick.auto.a", local.name)
+
+    def test_operate_local_hosts(self):
+        hosts = ["localhost", "127.0.0.1", "0.0.0.0"]
+        args = self.args(hosts=hosts)
+        rv = yardstick.ops.fleet.operate_fleet(
+            [yardstick.ops.modder, yardstick.ops.modder],
+            FleetTester.config, args, None,
+            name="yardstick.test"
+        )
+        self.assertEqual(hosts, list(rv.keys()))
+        self.assertTrue(all(i == [2, 2] for i in rv.values()), rv)
+
+    def test_check_local_hosts(self):
+        program = textwrap.dedent("""
+            config, args, sudoPwd, ts = [channel.receive() for i in range(4)]
+            channel.send({
+                "errors": [], "failures": ["fail"], "skipped": [], "total": 2
+            })
+            channel.send(None)
+        """)
+        hosts = ["localhost", "127.0.0.1"]
+        args = self.args(hosts=hosts)
+        rv = yardstick.ops.fleet.check_fleet(
+            [program, program, program], FleetTester.config, args, None,
+            name="yardstick.test"
+        )
+        self.assertEqual(hosts, list(rv.keys()))
+        for result in rv.values():
+            self.assertEqual(6, result["total"])
+            self.assertEqual(3, len(result["failures"]))
+
+
+class ReadinessTester(unittest.TestCase):
+
+    config = textwrap.dedent("""
+        [DEFAULT]
+        admin.net = 127.0.0.1/8
+        admin.port =
+        admin.user =
+        admin.python =
+
+        [hello]
+        type = Command
+        data = echo hello
+
+        [ready]
+        type = Wait
+        action = local
+        probe = port:{port}
+        interval = 0.2
+        limit = 2
+
+        [goodbye]
+        type = Command
+        data = echo goodbye
+    """)
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(("0.0.0.0", 0))
+        self.server.listen(16)
+        self.addCleanup(self.server.close)
+        self.port = self.server.getsockname()[1]
+
+    def closed_port(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def args(self, **kwargs):
+        return FleetTester.args(self, **kwargs)
+
+    def test_phases_divide_at_local_waits(self):
+        plan = yardstick.ops.base.plan_of(
+            ReadinessTester.config.format(port=self.port)
+        )
+        rv = list(yardstick.ops.fleet.gen_phases(plan))
+        self.assertEqual([(range(0, 1), 1), (range(2, 3), None)], rv)
+
+    def test_ready_hosts(self):
+        plan = yardstick.ops.base.plan_of(
+            ReadinessTester.config.format(port=self.port)
+        )
+        hosts = ["127.0.0.1", "127.0.0.2"]
+        rv = yardstick.ops.fleet.wait_fleet(
+            plan["sections"][1], hosts, self.args(hosts=hosts), None,
+            name="yardstick.test"
+        )
+        self.assertEqual(hosts, list(rv.keys()))
+        self.assertTrue(all(rv.values()))
+
+    def test_hosts_wait_concurrently(self):
+        plan = yardstick.ops.base.plan_of(
+            ReadinessTester.config.format(port=self.closed_port())
+        )
+        hosts = ["127.0.0.{}".format(i) for i in range(1, 9)]
+        then = time.monotonic()
+        rv = yardstick.ops.fleet.wait_fleet(
+            plan["sections"][1], hosts, self.args(hosts=hosts, probes=2),
+            None, name="yardstick.test"
+        )
+        self.assertFalse(any(rv.values()))
+        self.assertLess(time.monotonic() - then, 8 * 0.4)
+
+    def test_operate_through_barrier(self):
+        hosts = ["localhost", "127.0.0.1"]
+        rv = yardstick.ops.fleet.operate_fleet(
+            [yardstick.ops.modder],
+            ReadinessTester.config.format(port=self.port),
+            self.args(hosts=hosts), None,
+            name="yardstick.test"
+        )
+        self.assertEqual({"localhost": [3], "127.0.0.1": [3]}, rv)
+
+    def test_unready_hosts_stop_at_barrier(self):
+        hosts = ["localhost", "127.0.0.1"]
+        rv = yardstick.ops.fleet.operate_fleet(
+            [yardstick.ops.modder],
+            ReadinessTester.config.format(port=self.closed_port()),
+            self.args(hosts=hosts), None,
+            name="yardstick.test"
+        )
+        self.assertEqual({"localhost": [1], "127.0.0.1": [1]}, rv)
+
+
+class MergeTester(unittest.TestCase):
+
+    def test_merge_results(self):
+        rv = yardstick.ops.fleet.merge_results([
+            {"errors": ["a"], "failures": [], "skipped": ["b"], "total": 3},
+            {"errors": [], "failures": ["c"], "skipped": [], "total": 2},
+        ])
+        self.assertEqual(["a"], rv["errors"])
+        self.assertEqual(["c"], rv["failures"])
+        self.assertEqual(["b"], rv["skipped"])
+        self.assertEqual(5, rv["total"])
+
+    def test_merge_incomplete(self):
+        rv = yardstick.ops.fleet.merge_results([
+            None, "Connection lost",
+            {"errors": [], "failures": [], "skipped": [], "total": 1},
+        ])
+        self.assertEqual(2, len(rv["errors"]))
+        self.assertIn("Connection lost", rv["errors"][1])
+        self.assertEqual(1, rv["total"])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import re
+import subprocess
+import sys
+import textwrap
+import unittest
+
+
+class StartupTester(unittest.TestCase):
+
+    budget = 100000
+    """The time allowed to import the entry point, in microseconds."""
+
+    heavy = [
+        "concurrent.futures", "execnet", "inspect", "ipaddress",
+        "pkg_resources", "subprocess", "unittest",
+        "yardstick.ops.checker", "yardstick.ops.modder",
+    ]
+
+    program = textwrap.dedent("""
+        import sys
+        import yardstick.ops.main
+        p, subs = yardstick.ops.cli.parsers()
+        yardstick.ops.cli.add_auto_command_parser(subs)
+        yardstick.ops.cli.add_check_command_parser(subs)
+        yardstick.ops.cli.add_units_command_parser(subs)
+        p.parse_args(["--version"])
+        print(*sorted(i for i in {0} if i in sys.modules), sep="\\n")
+    """)
+
+    def run_startup(self):
+        return subprocess.run(
+            [
+                sys.executable, "-X", "importtime", "-c",
+                StartupTester.program.format(StartupTester.heavy)
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__))
+            )))
+        )
+
+    def test_heavy_modules_are_not_imported(self):
+        rv = self.run_startup()
+        self.assertEqual("", rv.stdout.strip())
+
+    def test_import_time_within_budget(self):
+        times = []
+        for i in range(3):
+            rv = self.run_startup()
+            times.extend(
+                int(i) for i in re.findall(
+                    r"^import time:\s+\d+ \|\s+(\d+) \| yardstick\.ops\.main$",
+                    rv.stderr, re.MULTILINE
+                )
+            )
+        self.assertEqual(3, len(times))
+        self.assertLess(min(times), StartupTester.budget)
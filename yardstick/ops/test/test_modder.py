@@ -16,13 +16,34 @@
 # You should have received a copy of the GNU General Public License
 # along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import os
+import re
+import socket
+import sys
 import tempfile
 import textwrap
+import threading
+import time
 import unittest
+from unittest import mock
 
+from yardstick.ops.modder import Batch
+from yardstick.ops.modder import coalesce_plan
+from yardstick.ops.modder import Command
+from yardstick.ops.modder import compile_pattern
+from yardstick.ops.modder import compile_plan
 from yardstick.ops.modder import config_parser
+from yardstick.ops.modder import Inotify
+from yardstick.ops.modder import log_message
+from yardstick.ops.modder import plan_parser
+from yardstick.ops.modder import run_graph
+from yardstick.ops.modder import run_section
+from yardstick.ops.modder import state_load
+from yardstick.ops.modder import state_save
+from yardstick.ops.modder import state_sign
 from yardstick.ops.modder import Text
+from yardstick.ops.modder import Wait
 
 
 class TextTester(unittest.TestCase):
@@ -143,7 +164,7 @@ class TextTester(unittest.TestCase):
         ini.read_string(config)
         kwargs = Text.arguments(**ini["vimrc"])
         self.assertIsInstance(kwargs, dict)
-        self.assertEqual(5, len(kwargs))
+        self.assertEqual(6, len(kwargs))
         self.assertNotIn("sudo", kwargs)
         self.assertNotIn("action", kwargs)
         self.assertNotIn("type", kwargs)
@@ -227,3 +248,693 @@ class TextTester(unittest.TestCase):
         finally:
             os.close(fd)
             os.remove(fP)
+
+
+class WriteTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "target.conf")
+        with open(self.path, 'w') as target:
+            target.write(TextTester.content)
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def text(self, path):
+        return Text(
+            path=path, seek="# a\\.a[\\w =]+$", data="a.a = True",
+            indent=0, newlines=0
+        )
+
+    def test_unchanged_file_is_not_written(self):
+        list(self.text(self.path)())
+        before = os.stat(self.path)
+        msgs = list(self.text(self.path)())
+        after = os.stat(self.path)
+        self.assertEqual(before.st_ino, after.st_ino)
+        self.assertEqual(before.st_mtime_ns, after.st_mtime_ns)
+        self.assertIn("unchanged", msgs[-1][2])
+
+    def test_changed_file_is_replaced(self):
+        before = os.stat(self.path)
+        msgs = list(self.text(self.path)())
+        after = os.stat(self.path)
+        self.assertNotEqual(before.st_ino, after.st_ino)
+        self.assertEqual(0o640, after.st_mode & 0o777)
+        self.assertTrue(msgs[-1][2].endswith("changed."))
+        self.assertEqual([self.path], [
+            os.path.join(self.dir.name, i) for i in os.listdir(self.dir.name)
+        ])
+
+    def test_symlink_is_kept(self):
+        link = os.path.join(self.dir.name, "link.conf")
+        os.symlink(self.path, link)
+        list(self.text(link)())
+        self.assertTrue(os.path.islink(link))
+        with open(self.path, 'r') as target:
+            self.assertIn("\na.a = True", "\n" + target.read())
+
+    def test_new_file_follows_umask(self):
+        path = os.path.join(self.dir.name, "new.conf")
+        prior = os.umask(0o027)
+        try:
+            list(Text(
+                path=path, seek=True, data="x = 1", indent=0, newlines=0
+            )())
+            self.assertEqual(0o027, os.umask(0o027))
+        finally:
+            os.umask(prior)
+        self.assertEqual(0o640, os.stat(path).st_mode & 0o777)
+
+    def test_new_file_is_created(self):
+        path = os.path.join(self.dir.name, "new.conf")
+        t = Text(path=path, seek=True, data="x = 1", indent=0, newlines=0)
+        list(t())
+        with open(path, 'r') as target:
+            self.assertEqual("\nx = 1", target.read())
+
+
+class StreamTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def edit(self, stream, **kwargs):
+        path = os.path.join(self.dir.name, "stream" if stream else "text")
+        with open(path, 'w') as target:
+            target.write(TextTester.content * 3)
+        os.chmod(path, 0o640)
+        t = Text(
+            path=path, indent=2, newlines=1, stream=stream,
+            **dict({"data": "c.\\1 = 1"}, **kwargs)
+        )
+        msgs = list(t())
+        with open(path, 'r') as target:
+            return (target.read(), msgs, os.stat(path))
+
+    def test_stream_matches_text(self):
+        for seek in ("^b\\.(\\w) = [^\\n]*$", True, False):
+            with self.subTest(seek=seek):
+                expect, _, _ = self.edit(False, seek=seek)
+                rv, msgs, st = self.edit(True, seek=seek)
+                self.assertEqual(expect, rv)
+                self.assertTrue(msgs[-1][2].endswith(" changed."))
+                self.assertEqual(0o640, st.st_mode & 0o777)
+
+    def test_small_chunks(self):
+        path = os.path.join(self.dir.name, "chunks")
+        with open(path, 'w') as target:
+            target.write(TextTester.content)
+        t = Text(
+            path=path, seek="b\\.b", data="B.B", indent=0, newlines=0,
+            stream=True
+        )
+        with open(path, 'rb') as input_:
+            chunks = list(t.gen_chunks(
+                input_.read(), re.compile(b"b\\.b"), size=4
+            ))
+        self.assertTrue(all(len(i) <= 4 for i in chunks))
+        self.assertEqual(
+            TextTester.content.replace("b.b", "B.B").encode("utf-8"),
+            b"".join(chunks)
+        )
+
+    def test_stream_logs_short_preview(self):
+        expect, _, _ = self.edit(False, seek=".*", data="x")
+        rv, msgs, _ = self.edit(True, seek=".*", data="x")
+        self.assertEqual(expect, rv)
+        debug = [i[2] for i in msgs if i[1] == logging.DEBUG]
+        self.assertEqual(1, len(debug))
+        self.assertIn("matched bytes 0-{}".format(
+            len(TextTester.content) * 3
+        ), debug[0])
+        self.assertLess(len(debug[0]), 120)
+
+    def test_unmatched_stream_is_unchanged(self):
+        expect, _, _ = self.edit(False, seek="^z = 0$")
+        rv, msgs, _ = self.edit(True, seek="^z = 0$")
+        self.assertEqual(expect, rv)
+        self.assertEqual(logging.WARNING, msgs[0][1])
+        self.assertIn("unchanged", msgs[-1][2])
+
+    def test_identical_stream_is_not_written(self):
+        path = os.path.join(self.dir.name, "same")
+        with open(path, 'w') as target:
+            target.write(TextTester.content)
+        before = os.stat(path)
+        t = Text(
+            path=path, seek="b\\.b", data="b.b", indent=0, newlines=0,
+            stream=True
+        )
+        msgs = list(t())
+        after = os.stat(path)
+        self.assertEqual(before.st_ino, after.st_ino)
+        self.assertIn("unchanged", msgs[-1][2])
+        self.assertEqual(["same"], os.listdir(self.dir.name))
+
+
+class BatchTester(unittest.TestCase):
+
+    class Channel:
+
+        def __init__(self):
+            self.sent = []
+
+        def send(self, obj):
+            self.sent.append(obj)
+
+    def test_log_message_is_compact(self):
+        msg = log_message(logging.INFO, "hello", name="yardstick.test")
+        self.assertIsInstance(msg, tuple)
+        self.assertEqual(("yardstick.test", logging.INFO, "hello"), msg[:3])
+
+    def test_batch_by_size(self):
+        channel = BatchTester.Channel()
+        batch = Batch(channel, size=3, interval=60)
+        for i in range(7):
+            batch.send(log_message(logging.INFO, str(i)))
+        self.assertEqual([3, 3], [len(i) for i in channel.sent])
+        batch.flush()
+        self.assertEqual([3, 3, 1], [len(i) for i in channel.sent])
+        batch.flush()
+        self.assertEqual(3, len(channel.sent))
+
+    def test_batch_by_interval(self):
+        channel = BatchTester.Channel()
+        batch = Batch(channel, size=100, interval=0.05)
+        batch.send(log_message(logging.INFO, "late"))
+        self.assertFalse(channel.sent)
+        time.sleep(0.2)
+        self.assertEqual(1, len(channel.sent))
+        self.assertEqual("late", channel.sent[0][0][2])
+
+
+class CommandTester(unittest.TestCase):
+
+    def test_output_and_errors(self):
+        op = Command(data="echo one; echo two >&2; echo three")
+        rv = list(op())
+        self.assertEqual(
+            ["one", "three"],
+            [i[2] for i in rv if i[1] == logging.INFO]
+        )
+        self.assertEqual(
+            ["two"],
+            [i[2] for i in rv if i[1] == logging.WARNING]
+        )
+
+    def test_quoted_whitespace_is_kept(self):
+        op = Command(data="echo 'a    b'")
+        self.assertEqual(["a    b"], [i[2] for i in op()])
+
+    def test_sudo_runs_the_whole_line(self):
+        with tempfile.TemporaryDirectory() as bin_:
+            sudo = os.path.join(bin_, "sudo")
+            with open(sudo, 'w') as file_:
+                file_.write(textwrap.dedent("""
+                    #!/bin/sh
+                    read pwd
+                    shift 3
+                    UNDER_SUDO=$pwd exec "$@"
+                """).lstrip())
+            os.chmod(sudo, 0o755)
+            path = os.pathsep.join((bin_, os.environ.get("PATH", "")))
+            with mock.patch.dict(os.environ, {"PATH": path}):
+                op = Command(data="echo first; printenv UNDER_SUDO")
+                rv = [i[2] for i in op(sudo=True, sudoPwd="secret")
+                      if i[1] == logging.INFO]
+        self.assertEqual(["first", "secret"], rv)
+
+    def test_exit_status(self):
+        op = Command(data="exit 3")
+        rv = list(op())
+        self.assertEqual(1, len(rv))
+        self.assertEqual(logging.WARNING, rv[0][1])
+        self.assertIn("3", rv[0][2])
+
+    def test_output_streams(self):
+        op = Command(data="echo first; sleep 1; echo last")
+        then = time.time()
+        gen = op()
+        first = next(gen)
+        self.assertLess(time.time() - then, 0.8)
+        self.assertEqual("first", first[2])
+        self.assertEqual(["last"], [i[2] for i in gen])
+
+    def test_bounded_buffer(self):
+        op = Command(data="seq 1 20000", _buffer=4)
+        rv = [int(i[2]) for i in op()]
+        self.assertEqual(list(range(1, 20001)), rv)
+
+
+class GraphTester(unittest.TestCase):
+
+    config = textwrap.dedent("""
+        [first]
+        type = Command
+        data = echo first
+
+        [slow_a]
+        group = slow
+        type = Command
+        data = sleep 0.4
+
+        [slow_b]
+        group = slow
+        type = Command
+        data = sleep 0.4
+
+        [then]
+        group = slow
+        after = slow_a, first
+        type = Command
+        data = echo then
+    """)
+
+    def run_stage(self, config, taskNrs):
+        ini = config_parser()
+        ini.read_string(config)
+        sent = []
+        rv = run_graph(
+            compile_plan(ini), taskNrs, None, sent.append, workers=4
+        )
+        return rv, sent
+
+    def test_independent_sections_overlap(self):
+        then = time.time()
+        rv, sent = self.run_stage(GraphTester.config, [1, 2, 3])
+        self.assertTrue(rv)
+        self.assertLess(time.time() - then, 0.75)
+
+    def test_after_is_respected(self):
+        rv, sent = self.run_stage(GraphTester.config, [1, 2, 3])
+        msgs = [i[2] for i in sent]
+        self.assertLess(msgs.index("Task 'slow_a'"), msgs.index("then"))
+        self.assertEqual(1, msgs.index("then") - msgs.index("Task 'then'"))
+
+    def test_later_dependency_is_an_error(self):
+        config = GraphTester.config.replace(
+            "after = slow_a, first", "after = nonesuch"
+        )
+        rv, sent = self.run_stage(config, [1, 2, 3])
+        self.assertFalse(rv)
+        self.assertEqual(logging.ERROR, sent[0][1])
+
+    def test_cycle_is_an_error(self):
+        config = GraphTester.config.replace(
+            "data = sleep 0.4", "after = then\ndata = true"
+        )
+        rv, sent = self.run_stage(config, [1, 2, 3])
+        self.assertFalse(rv)
+        self.assertTrue(all(i[1] == logging.ERROR for i in sent))
+        self.assertEqual(3, len(sent))
+
+
+class StateTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "target.conf")
+        ini = config_parser()
+        ini.read_string(textwrap.dedent("""
+            [edit]
+            type = Text
+            path = {0}
+            seek = True
+            data = x = 1
+
+            [touch]
+            type = Command
+            files = {0}
+            data = touch {0}
+
+            [echo]
+            type = Command
+            data = echo hello
+
+            [mkdir]
+            type = Command
+            files = {1}
+            data = mkdir -p {1}
+        """).format(self.path, os.path.join(self.dir.name, "sub")))
+        self.sections = {
+            i["name"]: i for i in compile_plan(ini)["sections"]
+        }
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_twice(self, secName, state, *secNames):
+        rv = []
+        for i in range(2):
+            sent = []
+            for name in (secName,) + secNames:
+                self.assertTrue(
+                    run_section(
+                        self.sections[name], None, sent.append, state=state
+                    )
+                )
+            state_sign(state)
+            rv.append(sent)
+        return rv
+
+    def test_unchanged_section_is_cached(self):
+        state = {}
+        first, second = self.run_twice("edit", state)
+        self.assertEqual("Task 'edit'", first[0][2])
+        self.assertEqual(["Task 'edit' cached."], [i[2] for i in second])
+        self.assertIn("edit", state)
+
+    def test_changed_file_is_run_again(self):
+        state = {}
+        self.run_twice("edit", state)
+        with open(self.path, 'a') as target:
+            target.write("\ny = 2")
+        sent = []
+        run_section(self.sections["edit"], None, sent.append, state=state)
+        self.assertEqual("Task 'edit'", sent[0][2])
+
+    def test_changed_section_is_run_again(self):
+        state = {}
+        self.run_twice("touch", state)
+        section = self.sections["touch"]
+        section["items"]["data"] = "true"
+        section["arguments"]["data"] = "true"
+        sent = []
+        run_section(section, None, sent.append, state=state)
+        self.assertEqual("Task 'touch'", sent[0][2])
+
+    def test_sections_on_one_file_are_cached(self):
+        state = {}
+        first, second = self.run_twice("edit", state, "touch")
+        self.assertEqual(
+            ["Task 'edit' cached.", "Task 'touch' cached."],
+            [i[2] for i in second]
+        )
+        with open(self.path, 'r') as target:
+            self.assertEqual(1, target.read().count("x = 1"))
+
+    def test_directory_is_signed(self):
+        state = {}
+        first, second = self.run_twice("mkdir", state)
+        self.assertEqual(["Task 'mkdir' cached."], [i[2] for i in second])
+        open(os.path.join(self.dir.name, "sub", "new"), 'w').close()
+        sent = []
+        run_section(self.sections["mkdir"], None, sent.append, state=state)
+        self.assertEqual("Task 'mkdir'", sent[0][2])
+
+    def test_section_without_files_always_runs(self):
+        state = {}
+        first, second = self.run_twice("echo", state)
+        self.assertEqual("Task 'echo'", second[0][2])
+        self.assertNotIn("echo", state)
+
+    def test_state_round_trip(self):
+        state = {}
+        self.run_twice("edit", state)
+        path = os.path.join(self.dir.name, "state", "state.json")
+        self.assertEqual({}, state_load(path))
+        state_save(state, path)
+        self.assertEqual(state, state_load(path))
+
+
+class PlanTester(unittest.TestCase):
+
+    config = textwrap.dedent("""
+        [DEFAULT]
+        admin.user = admin
+
+        [rc]
+        sudo = True
+        type = Text
+        path = /home/${admin.user}/.rc
+        seek = False
+        data = cost = $$5
+        indent = 4
+
+        [broken]
+        type = Text
+        indent = four
+
+        [later]
+        group = one
+        after = rc, broken
+        type = Command
+        data = echo ${rc:path}
+    """)
+
+    def setUp(self):
+        ini = config_parser()
+        ini.read_string(PlanTester.config)
+        self.plan = compile_plan(ini)
+
+    def test_sections_are_resolved(self):
+        self.assertEqual({"admin.user": "admin"}, self.plan["settings"])
+        rc, broken, later = self.plan["sections"]
+        self.assertEqual("/home/admin/.rc", rc["arguments"]["path"])
+        self.assertIs(False, rc["arguments"]["seek"])
+        self.assertEqual(4, rc["arguments"]["indent"])
+        self.assertIs(True, rc["sudo"])
+        self.assertEqual(["/home/admin/.rc"], rc["files"])
+        self.assertEqual("echo /home/admin/.rc", later["arguments"]["data"])
+        self.assertEqual(["rc", "broken"], later["after"])
+        self.assertEqual("one", later["group"])
+        self.assertEqual("remote", later["action"])
+
+    def test_bad_section_carries_error(self):
+        broken = self.plan["sections"][1]
+        self.assertIn("four", broken["error"])
+        sent = []
+        self.assertFalse(run_section(broken, None, sent.append))
+        self.assertEqual(logging.ERROR, sent[-1][1])
+        self.assertIn("four", sent[-1][2])
+
+    def test_bad_patterns_fail_at_compilation(self):
+        ini = config_parser()
+        ini.read_string(textwrap.dedent("""
+            [text]
+            type = Text
+            seek = ^(unclosed
+
+            [wait]
+            type = Wait
+            data = ls
+            condition = [z-a]
+        """))
+        text, wait = compile_plan(ini)["sections"]
+        self.assertIn("missing )", text["error"])
+        self.assertIn("bad character range", wait["error"])
+
+    def test_patterns_are_compiled_once(self):
+        flags = re.DOTALL | re.MULTILINE
+        self.assertIs(
+            compile_pattern("^b\\.a", flags),
+            compile_pattern("^b\\.a", flags)
+        )
+        self.assertIsNot(
+            compile_pattern("^b\\.a", flags),
+            compile_pattern("^b\\.a")
+        )
+
+    def test_parser_does_not_interpolate_again(self):
+        ini = plan_parser(self.plan)
+        self.assertEqual("cost = $5", ini["rc"]["data"])
+        self.assertEqual("admin", ini["later"]["admin.user"])
+        self.assertEqual(["rc", "broken", "later"], ini.sections())
+
+
+class CoalesceTester(unittest.TestCase):
+
+    config = textwrap.dedent("""
+        [DEFAULT]
+        target = {path}
+
+        [a]
+        type = Text
+        path = ${{target}}
+        seek = ^# a\\.a = False$$
+        data = a.a = True
+
+        [b]
+        type = Text
+        path = ${{target}}
+        seek = ^b\\.b = .*$$
+        data = b.b = "changed"
+
+        [c]
+        type = Text
+        path = ${{target}}
+        seek = True
+        data = c.a = True
+        newlines = 1
+
+        [other]
+        type = Command
+        data = echo
+
+        [d]
+        type = Text
+        path = ${{target}}
+        seek = False
+        data = # top
+
+        [e]
+        type = Text
+        path = ${{target}}
+        seek = False
+        data = # not merged
+
+        [f]
+        after = e
+        type = Command
+        data = echo
+    """)
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "target.conf")
+        with open(self.path, 'w') as target:
+            target.write(TextTester.content)
+        ini = config_parser()
+        ini.read_string(CoalesceTester.config.format(path=self.path))
+        self.plan = compile_plan(ini)
+
+    def test_consecutive_edits_are_merged(self):
+        rv = coalesce_plan(self.plan)
+        self.assertEqual(
+            ["a + b + c", "other", "d", "e", "f"],
+            [i["name"] for i in rv["sections"]]
+        )
+        self.assertEqual(
+            ["a", "b", "c"], [i["name"] for i in rv["sections"][0]["edits"]]
+        )
+        self.assertEqual([self.path], rv["sections"][0]["files"])
+
+    def test_merged_edits_match_separate_ones(self):
+        for section in self.plan["sections"][:3]:
+            self.assertTrue(run_section(section, None, lambda x: None))
+        with open(self.path, 'r') as target:
+            expect = target.read()
+
+        with open(self.path, 'w') as target:
+            target.write(TextTester.content)
+        sent = []
+        merged = coalesce_plan(self.plan)["sections"][0]
+        self.assertTrue(run_section(merged, None, sent.append))
+        with open(self.path, 'r') as target:
+            self.assertEqual(expect, target.read())
+        self.assertEqual(
+            1, len([i for i in sent if i[2].endswith(" changed.")])
+        )
+
+    def test_parser_restores_merged_sections(self):
+        ini = plan_parser(coalesce_plan(self.plan))
+        self.assertEqual(
+            ["a", "b", "c", "other", "d", "e", "f"], ini.sections()
+        )
+        self.assertEqual("c.a = True", ini["c"]["data"])
+
+
+class WaitTester(unittest.TestCase):
+
+    def wait(self, **kwargs):
+        return Wait(**Wait.arguments(**kwargs))
+
+    def test_backoff_to_ceiling(self):
+        op = self.wait(interval="1", backoff="2", ceiling="5", limit="5")
+        self.assertEqual([1, 2, 4, 5, 5], list(op.delays()))
+
+    def test_jitter_within_bounds(self):
+        op = self.wait(interval="1", jitter="0.5", limit="100")
+        self.assertTrue(all(0.5 <= i <= 1.5 for i in op.delays()))
+
+    def test_deadline_ends_attempts(self):
+        op = self.wait(interval="0.1", deadline="0.25", limit="100")
+        then = time.monotonic()
+        for pause in op.delays():
+            time.sleep(pause)
+        self.assertLess(time.monotonic() - then, 0.5)
+
+    def test_unknown_probe(self):
+        with self.assertRaises(ValueError):
+            Wait.arguments(probe="nonesuch:x")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Needs inotify")
+    def test_inotify_does_not_search_for_libc(self):
+        with mock.patch(
+            "ctypes.util.find_library", side_effect=AssertionError
+        ):
+            watcher = Inotify()
+        watcher.close()
+
+    def test_file_probe_ends_on_write(self):
+        with tempfile.TemporaryDirectory() as parent:
+            path = os.path.join(parent, "ready")
+
+            def write():
+                time.sleep(0.2)
+                with open(path, 'w') as output:
+                    output.write("status: up\n")
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            op = self.wait(
+                probe="file:{}".format(path), condition="up$",
+                interval="2", limit="3"
+            )
+            then = time.monotonic()
+            msgs = list(op())
+            writer.join()
+        self.assertLess(time.monotonic() - then, 1.5)
+        self.assertEqual(logging.INFO, msgs[-1][1])
+
+    def test_file_probe_ignores_other_files(self):
+        with tempfile.TemporaryDirectory() as parent:
+            path = os.path.join(parent, "ready")
+            done = threading.Event()
+
+            def churn():
+                while not done.is_set():
+                    with open(os.path.join(parent, "busy"), 'w') as output:
+                        output.write("x")
+                    time.sleep(0.01)
+
+            writer = threading.Thread(target=churn)
+            writer.start()
+            op = self.wait(
+                probe="file:{}".format(path), interval="0.2", limit="2"
+            )
+            then = time.monotonic()
+            try:
+                msgs = list(op())
+            finally:
+                done.set()
+                writer.join()
+        self.assertGreater(time.monotonic() - then, 0.35)
+        self.assertEqual(logging.WARNING, msgs[-1][1])
+
+    def test_port_probe(self):
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+            port = server.getsockname()[1]
+            op = self.wait(probe="port:127.0.0.1:{}".format(port))
+            self.assertEqual(logging.INFO, list(op())[-1][1])
+
+        op = self.wait(
+            probe="port:127.0.0.1:{}".format(port), interval="0", limit="2"
+        )
+        self.assertEqual(logging.WARNING, list(op())[-1][1])
+
+    def test_process_probe(self):
+        with open("/proc/self/comm", 'r') as comm:
+            name = comm.read().strip()
+        op = self.wait(probe="process:{}".format(name))
+        self.assertEqual(logging.INFO, list(op())[-1][1])
+
+        op = self.wait(probe="process:nonesuch-process", interval="0", limit="1")
+        self.assertEqual(logging.WARNING, list(op())[-1][1])
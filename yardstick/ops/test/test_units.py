@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import os.path
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+import yardstick.ops.discovery
+import yardstick.ops.units
+
+
+class UnitsTester(unittest.TestCase):
+
+    source = textwrap.dedent('''
+        import unittest
+
+        class Helper:
+
+            def test_not_a_unit(self):
+                pass
+
+        class AccessChecks(unittest.TestCase):
+            """
+            :tags: ssh, access
+            """
+            config = "/etc/ssh/sshd_config"
+
+            def test_port(self):
+                """
+                :tags: network
+                """
+                pass
+
+            def test_keys(self):
+                self.assertTrue(open("/root/.ssh/authorized_keys"))
+
+        class MoreChecks(AccessChecks):
+
+            def test_more(self):
+                pass
+    ''')
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.index = os.path.join(self.dir.name, "cache", "units.json")
+        self.tests = os.path.join(self.dir.name, "tests")
+        os.mkdir(self.tests)
+        with open(os.path.join(self.tests, "test_access.py"), 'w') as src:
+            src.write(UnitsTester.source)
+        with open(os.path.join(self.tests, "helpers.py"), 'w') as src:
+            src.write("class NotFound:\n    pass\n")
+
+    def tearDown(self):
+        if self.tests in sys.path:
+            sys.path.remove(self.tests)
+        sys.modules.pop("test_access", None)
+        self.dir.cleanup()
+
+    def args(self, **kwargs):
+        rv = argparse.Namespace(
+            modules=[], paths=[self.tests], include=[], exclude=[]
+        )
+        for k, v in kwargs.items():
+            setattr(rv, k, v)
+        return rv
+
+    def test_units_from_source(self):
+        units = list(yardstick.ops.units.gen_units(
+            UnitsTester.source, "test_access"
+        ))
+        self.assertEqual(
+            ["test_port", "test_keys", "test_more"],
+            [i["method"] for i in units]
+        )
+        port, keys, more = units
+        self.assertEqual(["access", "network", "ssh"], port["tags"])
+        self.assertEqual(["access", "ssh"], keys["tags"])
+        self.assertEqual(
+            ["/etc/ssh/sshd_config", "/root/.ssh/authorized_keys"],
+            keys["files"]
+        )
+        self.assertEqual("MoreChecks", more["class"])
+        self.assertEqual([], more["tags"])
+
+    def test_matches(self):
+        unit = {
+            "module": "a.test_b", "class": "C", "method": "test_d",
+            "tags": ["ssh"], "files": ["/etc/ssh/sshd_config"],
+        }
+        self.assertTrue(yardstick.ops.units.matches(unit, "a.*.test_d"))
+        self.assertTrue(yardstick.ops.units.matches(unit, "tags=ssh"))
+        self.assertTrue(yardstick.ops.units.matches(unit, "files=/etc/*"))
+        self.assertTrue(yardstick.ops.units.matches(unit, "class=C"))
+        self.assertFalse(yardstick.ops.units.matches(unit, "tags=net*"))
+        self.assertFalse(yardstick.ops.units.matches(unit, "owner=*"))
+
+    def test_query_filters(self):
+        rv = yardstick.ops.units.query(
+            self.args(include=["tags=ssh"], exclude=["*.test_port"]),
+            path=self.index
+        )
+        self.assertEqual(["test_keys"], [i["method"] for i in rv])
+        self.assertEqual("test_access", rv[0]["module"])
+        self.assertTrue(os.path.isfile(self.index))
+
+    def test_index_parses_changed_files_only(self):
+        gen_units = yardstick.ops.units.gen_units
+        with mock.patch.object(
+            yardstick.ops.units, "gen_units", wraps=gen_units
+        ) as parser:
+            yardstick.ops.units.query(self.args(), path=self.index)
+            yardstick.ops.units.query(self.args(), path=self.index)
+            self.assertEqual(1, parser.call_count)
+
+            fP = os.path.join(self.tests, "test_access.py")
+            with open(fP, 'a') as src:
+                src.write("\n# Edited\n")
+            rv = yardstick.ops.units.query(self.args(), path=self.index)
+            self.assertEqual(2, parser.call_count)
+        self.assertEqual(3, len(rv))
+
+    def test_import_selected_classes(self):
+        rv = list(yardstick.ops.units.gen_test_classes(
+            yardstick.ops.units.query(
+                self.args(include=["class=More*"]), path=self.index
+            )
+        ))
+        self.assertEqual(["MoreChecks"], [i.__name__ for i in rv])
+        self.assertTrue(issubclass(rv[0], unittest.TestCase))
+
+    def test_missing_module_is_skipped(self):
+        with self.assertLogs("yardstick.units", level="WARNING") as logs:
+            rv = list(yardstick.ops.units.gen_sources(argparse.Namespace(
+                modules=["nonexistent.pkg", "nonexistent"], paths=[]
+            )))
+        self.assertFalse([i for i in rv if i[1].startswith("nonexistent")])
+        self.assertEqual(2, len(logs.records))
+
+    def test_plugins_may_be_left_out(self):
+        with mock.patch.object(
+            yardstick.ops.discovery, "entry_points", return_value=[
+                ("more", "yardstick.ops.test.test_units:UnitsTester")
+            ]
+        ) as entry_points:
+            rv = list(yardstick.ops.units.gen_sources(
+                self.args(), plugins=False
+            ))
+            entry_points.assert_not_called()
+            self.assertNotIn(["UnitsTester"], [i[3] for i in rv])
+
+            rv = list(yardstick.ops.units.gen_sources(self.args()))
+            self.assertIn(["UnitsTester"], [i[3] for i in rv])
+
+    def test_import_loads_nothing(self):
+        code = textwrap.dedent("""
+            import sys
+            import yardstick.ops.units
+            print("yardstick.ops.modder" in sys.modules)
+        """)
+        rv = subprocess.check_output(
+            [sys.executable, "-c", code], universal_newlines=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__))
+            )))
+        )
+        self.assertEqual("False", rv.strip())
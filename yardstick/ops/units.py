@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+
+# This file is part of yardstick.
+#
+# yardstick is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# yardstick is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with yardstick.  If not, see <http://www.gnu.org/licenses/>.
+
+import ast
+import fnmatch
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import os.path
+import re
+import sys
+
+import yardstick.ops.discovery
+
+__doc__ = """
+This module keeps a catalogue of test units.
+
+A unit is a single test method. The catalogue is made by parsing the
+source of test modules, so they need not be imported to be searched.
+It is stored as an index in the cache directory. Each source file in
+the index is parsed again only when its size or modification time
+changes.
+
+Each unit has these attributes:
+
+* module
+* class
+* method
+* tags
+    From any lines of the form `:tags: a, b` in the docstring of
+    the class or method.
+* files
+    Absolute paths named by string literals in the class or method.
+
+"""
+
+DFLT_INDEX = os.path.expanduser(
+    os.path.join("~", ".cache", "yardstick", "units.json")
+)
+
+
+def gen_tags(doc):
+    """
+    Generate the tags declared in a docstring.
+
+    """
+    for line in re.findall(r"^\s*:tags:(.*)$", doc or "", re.MULTILINE):
+        yield from (i for i in re.split(r"[,\s]+", line) if i)
+
+
+def gen_files(node):
+    """
+    Generate the absolute file paths named in the source under `node`.
+
+    """
+    for child in ast.walk(node):
+        if (
+            isinstance(child, ast.Constant) and
+            isinstance(child.value, str) and
+            re.match(r"^/[^\s]*$", child.value)
+        ):
+            yield child.value
+
+
+def gen_units(text, module, path="", root=""):
+    """
+    Generate the test units defined in the source of a module.
+
+    A class is taken to hold tests if it derives from `TestCase`, or
+    from another class of tests in the same module.
+
+    :param text: The source of the module.
+    :param module: The dotted name of the module.
+    :param path: The file of the module.
+    :param root: The directory from which the module is imported.
+    :returns: A generator of dictionaries, one for each test method.
+    """
+    tree = ast.parse(text, filename=path)
+    classes = set()
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        bases = {
+            getattr(i, "attr", getattr(i, "id", None)) for i in node.bases
+        }
+        if not ("TestCase" in bases or bases & classes):
+            continue
+        classes.add(node.name)
+
+        methods = [
+            i for i in node.body
+            if isinstance(i, ast.FunctionDef) and i.name.startswith("test")
+        ]
+        common = [i for i in node.body if i not in methods]
+        tags = list(gen_tags(ast.get_docstring(node)))
+        files = {j for i in common for j in gen_files(i)}
+        for meth in methods:
+            yield {
+                "module": module,
+                "class": node.name,
+                "method": meth.name,
+                "tags": sorted(set(tags + list(gen_tags(
+                    ast.get_docstring(meth)
+                )))),
+                "files": sorted(files.union(gen_files(meth))),
+                "path": path,
+                "root": root,
+                "line": meth.lineno,
+            }
+
+
+def gen_package_sources(path, package=None, root=None, pattern="test*.py"):
+    """
+    Generate the test modules in a directory.
+
+    Like :py:meth:`unittest.TestLoader.discover`, this descends only
+    into those directories which are packages.
+
+    :param path: The directory to search.
+    :param package: The dotted name of the package at `path`, or None
+        if `path` is itself the place modules are imported from.
+    :returns: A generator of (path, module, root) tuples.
+    """
+    root = root or path
+    for name in sorted(os.listdir(path)):
+        fP = os.path.join(path, name)
+        prefix = "{}.".format(package) if package else ""
+        if os.path.isfile(fP) and fnmatch.fnmatch(name, pattern):
+            yield (fP, prefix + os.path.splitext(name)[0], root)
+        elif os.path.isfile(os.path.join(fP, "__init__.py")):
+            yield from gen_package_sources(
+                fP, prefix + name, root, pattern
+            )
+
+
+def gen_sources(args, plugins=True):
+    """
+    Generate the source files of the tests named on the command line
+    and by installed plugins.
+
+    :param plugins: Set False to leave out the test classes of plugins,
+        so that only those named on the command line are found.
+    :returns: A generator of (path, module, root, classes) tuples.
+        `classes` is a list of class names to take from the module,
+        or None for all of them.
+    """
+    for name in args.modules:
+        try:
+            spec = importlib.util.find_spec(name)
+        except ImportError:
+            spec = None
+        if spec is None:
+            logging.getLogger("yardstick.units").warning(
+                "Module {} not found.".format(name)
+            )
+            continue
+        locations = spec.submodule_search_locations
+        if locations:
+            root = os.path.join(
+                *[locations[0]] + [os.pardir] * (name.count(".") + 1)
+            )
+            for path in locations:
+                for fP, mod, root in gen_package_sources(
+                    path, name, os.path.normpath(root)
+                ):
+                    yield (fP, mod, root, None)
+        elif spec.origin:
+            yield (spec.origin, name, "", None)
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            path = os.path.abspath(path)
+            for fP, mod, root in gen_package_sources(path):
+                yield (fP, mod, root, None)
+        elif os.path.isfile(path):
+            fP = os.path.abspath(path)
+            yield (
+                fP, os.path.splitext(os.path.basename(fP))[0],
+                os.path.dirname(fP), None
+            )
+
+    if not plugins:
+        return
+
+    for name, value in yardstick.ops.discovery.entry_points(
+        "yardstick.plugin.testcase"
+    ):
+        mod, _, attr = value.partition(":")
+        try:
+            spec = importlib.util.find_spec(mod.strip())
+        except ImportError:
+            continue
+        if spec and spec.origin:
+            yield (spec.origin, spec.name, "", [attr.strip()])
+
+
+def load_index(path=DFLT_INDEX):
+    """
+    Read the index of units.
+
+    """
+    try:
+        with open(path, 'r') as input_:
+            return json.load(input_)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def update_index(sources, index):
+    """
+    Bring the index up to date with some source files.
+
+    A file is parsed only if it is new to the index, or its size or
+    modification time have changed.
+
+    :param sources: A sequence of tuples as generated by
+        :py:func:`gen_sources`.
+    :param index: A dictionary as returned by :py:func:`load_index`.
+        It is modified in place.
+    :returns: True if the index was changed.
+    """
+    rv = False
+    for path, module, root, classes in sources:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        key = [st.st_size, st.st_mtime_ns]
+        entry = index.get(path)
+        if entry and entry["key"] == key and entry["name"] == [module, root]:
+            continue
+
+        try:
+            with open(path, 'r') as input_:
+                text = input_.read()
+            units = list(gen_units(text, module, path, root))
+        except (SyntaxError, UnicodeDecodeError, ValueError):
+            units = []
+        index[path] = {"key": key, "name": [module, root], "units": units}
+        rv = True
+    return rv
+
+
+def save_index(index, path=DFLT_INDEX):
+    """
+    Store the index of units.
+
+    """
+    import yardstick.ops.modder
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    yardstick.ops.modder.write_atomic(path, json.dumps(index))
+
+
+def matches(unit, pattern):
+    """
+    Decide if a unit matches a pattern.
+
+    A pattern of the form `key=glob` is compared to the attribute
+    `key` of the unit. For a list like `tags`, any item may match.
+    Any other pattern is compared to the full name of the unit,
+    `module.class.method`.
+
+    """
+    key, sep, glob = pattern.partition("=")
+    if not sep:
+        return fnmatch.fnmatchcase(
+            "{module}.{class}.{method}".format(**unit), pattern
+        )
+
+    value = unit.get(key)
+    if isinstance(value, list):
+        return any(fnmatch.fnmatchcase(str(i), glob) for i in value)
+    return value is not None and fnmatch.fnmatchcase(str(value), glob)
+
+
+def select(units, include=None, exclude=None):
+    """
+    Filter a sequence of units.
+
+    :param include: A sequence of patterns. If given, a unit must
+        match at least one of them.
+    :param exclude: A sequence of patterns. A unit which matches any
+        one of them is left out.
+    :returns: A generator of units.
+    """
+    for unit in units:
+        if include and not any(matches(unit, i) for i in include):
+            continue
+        if exclude and any(matches(unit, i) for i in exclude):
+            continue
+        yield unit
+
+
+def query(args, path=DFLT_INDEX, plugins=True):
+    """
+    Find the units named by the command line.
+
+    The index is brought up to date and saved first if necessary.
+
+    :param plugins: Passed on to :py:func:`gen_sources`.
+    :returns: A list of units sorted by module, class and line number.
+    """
+    index = load_index(path)
+    sources = list(gen_sources(args, plugins=plugins))
+    if update_index(sources, index):
+        try:
+            save_index(index, path)
+        except OSError:
+            pass
+
+    wanted = {}
+    for fP, module, root, classes in sources:
+        if classes is None or wanted.get(fP, []) is None:
+            wanted[fP] = None
+        else:
+            wanted[fP] = wanted.get(fP, []) + classes
+    units = (
+        unit for fP, classes in wanted.items()
+        for unit in index.get(fP, {}).get("units", [])
+        if classes is None or unit["class"] in classes
+    )
+    return sorted(
+        select(
+            units,
+            getattr(args, "include", None), getattr(args, "exclude", None)
+        ),
+        key=lambda x: (x["module"], x["class"], x["line"])
+    )
+
+
+def gen_test_classes(units):
+    """
+    Import the classes of tests which hold some units.
+
+    Only the modules of those classes are imported.
+
+    :returns: A generator of test classes.
+    """
+    seen = set()
+    for unit in units:
+        name = (unit["module"], unit["class"])
+        if name in seen:
+            continue
+        seen.add(name)
+
+        if unit["root"] and unit["root"] not in sys.path:
+            sys.path.insert(0, unit["root"])
+        mod = importlib.import_module(unit["module"])
+        yield getattr(mod, unit["class"])
@@ -39,48 +39,49 @@ class OpenSSHChecks(unittest.TestCase):
     args = None
     sudoPwd = None
     ts = None
+    snapshot = None
 
     def test_initial_config_copied_to_ref(self):
         st = os.stat("/etc/ssh/sshd_config")
         self.assertTrue(os.path.isfile("/etc/ssh/sshd_config.ref"))
 
     def test_sshd_on_defined_port(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         port = self.settings["admin.port"]
         self.assertEqual(1, cfg.count("Port"))
         self.assertIn("Port {}".format(port), cfg)
 
     def test_sshd_port_not_claimed(self):
-        svcs = open("/etc/services").read()
+        svcs = self.snapshot.text("/etc/services")
         port = self.settings["admin.port"]
         self.assertNotIn(port, svcs)
 
     def test_keybased_authentication_is_enabled(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         self.assertEqual(1, cfg.count("\nRSAAuthentication"))
         self.assertEqual(1, cfg.count("\nPubkeyAuthentication"))
         self.assertIn("RSAAuthentication yes", cfg)
         self.assertIn("PubkeyAuthentication yes", cfg)
 
     def test_forwarding_is_disabled(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         self.assertEqual(1, cfg.count("AllowTcpForwarding"))
         self.assertEqual(1, cfg.count("X11Forwarding"))
         self.assertIn("AllowTcpForwarding no", cfg)
         self.assertIn("X11Forwarding no", cfg)
 
     def test_verbose_logging(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         self.assertEqual(1, cfg.count("LogLevel"))
         self.assertIn("LogLevel VERBOSE", cfg)
 
     def test_group_permission(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         self.assertEqual(1, cfg.count("AllowUsers"))
         self.assertIn("AllowUsers {}\n".format(self.settings["admin.user"]), cfg)
 
     def test_root_login(self):
-        cfg = open("/etc/ssh/sshd_config").read()
+        cfg = self.snapshot.text("/etc/ssh/sshd_config")
         self.assertEqual(1, cfg.count("PermitRootLogin"))
         self.assertIn("PermitRootLogin no", cfg)
 
@@ -89,4 +90,4 @@ class OpenSSHChecks(unittest.TestCase):
             os.path.expanduser("~{}".format(self.settings["admin.user"])),
             ".ssh", "authorized_keys")
         self.assertTrue(os.path.isfile(auth_keys))
-        self.assertEqual(1, len(open(auth_keys).readlines()))
+        self.assertEqual(1, len(self.snapshot.lines(auth_keys)))